@@ -4,12 +4,13 @@
 # Converted to Python from MATLAB by Ali Azak 2023
 # Last updated: May 2023
 #
-# Demo 1-3: Sea state 6, long-crested waves, no ship speed,
-# Demo 4:   Sea state 3, long-crested waves, no ship speed
-# Demo 5:   Sea state 3, long-crested waves, ship speed of 15 knots
-# Demo 6:   Sea state 3, short-crested waves, ship speed of 15 knots
-# Demo 7:   No waves, stabilization test
-# Demo 8:   Sea state 3, corridor test, ship speed of 15 knots
+# Demo 1-2: Sea state 6, long-crested waves, no ship speed
+# Demo 3:   Sea state 3, long-crested waves, no ship speed
+# Demo 4:   Sea state 3, long-crested waves, ship speed of 15 knots
+# Demo 5:   No waves, stabilization test
+# Demo 6:   Sea state 3, corridor test, ship speed of 15 knots
+# Demo 7:   Sea state 3, corridor test on a procedural sea, ship speed of
+#           15 knots
 
 
 import os
@@ -133,5 +134,20 @@ shipStruct['refSpeedU']   = 7
 waveFile = f'{os.path.abspath(current_dir)}/wave_files/waves__seaState_3__long__beta_3.14__grid_850x100__time_0_0.2_90__U_0.mat'
 states, face, vert, cogVec = simulateShip(waveFile, shipStruct, True, True,6)
 
-
-
+'''
+##--------------- Demo #7: Corridor test on a procedural sea
+# ------- Use wave with properties below
+# Sea state:        3
+# Wave type :       long-crested, generated in a window following the ship
+# Grid:             none (unbounded)
+# Time:             0:0.2:90
+# Ship speed        7 m/s
+from simulateWaves import createWaveComponents
+wavesStruct = {}
+wavesStruct['beta'] = np.pi
+wavesStruct['Ts'] = 0.2
+wavesStruct['tVec'] = np.arange(0, 90+wavesStruct['Ts'], wavesStruct['Ts'])
+wavesStruct['components'] = createWaveComponents(3, wavesStruct['beta'], 0)
+shipStruct['refSpeedU']   = 7
+states, face, vert, cogVec = simulateShip(wavesStruct, shipStruct, True, True,7, windowMargin=20)
+'''
@@ -2,7 +2,7 @@ import numpy as np
 import scipy.io as sio
 import sys
 import os
-from simulateWaves import simulateWaves
+from simulateWaves import simulateWaves, createWaveComponents
 
 # Get the current directory
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -10,15 +10,34 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 help_files_path = os.path.join(current_dir, 'help-files')
 sys.path.append(help_files_path)
 from getSignificantWaveHeight import getSignificantWaveHeight
+from loadWavesFile import saveWavesNpy
 
 # Demonstration of how to create wave files with different wave properties.
 # Authors: Matheus Bernat & Ludvig Granström 2021
 # Converted to Python from MATLAB by Ali Azak 2023
 # Last updated: May 2023
 
+# Helper function to name wave files
+def getWavesFileName(wavesStruct, extension='.mat'):
+    return f"{os.path.abspath(current_dir)}/wave_files/waves__seaState_{wavesStruct['seaState']}__{wavesStruct['waveType']}__beta_{round(wavesStruct['beta'], 2)}__grid_{len(wavesStruct['xVec'])}x{len(wavesStruct['yVec'])}__time_0_{wavesStruct['Ts']}_{int(wavesStruct['tVec'][-1])}__U_{wavesStruct['U']}{extension}"
+
 # Helper function to save wave files
-def saveWavesFile(wavesStruct):
-    fileName = f"{os.path.abspath(current_dir)}/wave_files/waves__seaState_{wavesStruct['seaState']}__{wavesStruct['waveType']}__beta_{round(wavesStruct['beta'], 2)}__grid_{len(wavesStruct['xVec'])}x{len(wavesStruct['yVec'])}__time_0_{wavesStruct['Ts']}_{int(wavesStruct['tVec'][-1])}__U_{wavesStruct['U']}.mat"
+# By default the grid goes to a time-major .npy sidecar next to the .mat
+# file, which simulateShip then memory-maps instead of decoding it
+def saveWavesFile(wavesStruct, sidecar=True):
+    if 'components' in wavesStruct:
+        # Spectral wave file: only the components and the grid/time vectors
+        # are stored, loadWavesFile/getWavesWindow rebuild the field
+        fileName = getWavesFileName(wavesStruct, '__spectral.mat')
+    else:
+        fileName = getWavesFileName(wavesStruct)
+    if sidecar and 'waves' in wavesStruct and not isinstance(wavesStruct['waves'], np.memmap):
+        wavesStruct = dict(wavesStruct)
+        wavesStruct['waves'] = saveWavesNpy(wavesStruct['waves'], getWavesFileName(wavesStruct, '.npy'))
+    if isinstance(wavesStruct.get('waves'), np.memmap):
+        # Waves are in a .npy file, store only its path
+        wavesStruct = dict(wavesStruct)
+        wavesStruct['wavesFile'] = wavesStruct.pop('waves').filename
     sio.savemat(fileName, {'wavesStruct': wavesStruct})
     print(f"Saved waves into file '{fileName}'")
 
@@ -256,12 +275,14 @@ wavesStruct['yVec'] = np.linspace(0, 99, 100)
 wavesStruct['Ts'] = 0.2
 wavesStruct['tVec'] = np.arange(0, 90+wavesStruct['Ts'], wavesStruct['Ts'])
 wavesStruct['U'] = 0
+wavesStruct['waveType'] = 'long'
 
+# Large grid: stream the waves to a .npy file next to the .mat file
 wavesStruct['waves'] = simulateWaves(wavesStruct['seaState'],
                                      wavesStruct['xVec'], wavesStruct['yVec'],
                                      wavesStruct['beta'], wavesStruct['tVec'],
-                                     wavesStruct['U'])
-wavesStruct['waveType'] = 'long'
+                                     wavesStruct['U'],
+                                     outFile=getWavesFileName(wavesStruct, '.npy'))
 
 wavesStruct['displayName'] = f"Waves with properties: " \
                              f"\n   -Sea state: {wavesStruct['seaState']}" \
@@ -311,13 +332,38 @@ wavesStruct['displayName'] = f"Waves with properties: " \
 
 saveWavesFile(wavesStruct)
 
+## Wave #9: Sea state 3 wave coming from bow (front), spectral file
+# ------- Use wave with properties below
+# Sea state:        3
+# Wave type (beta): long-crested
+# Wave angle:       180 degrees (from the stern)
+# Grid:             850x100
+# Time:             0:0.2:90
+# Relative speed    0 m/s
+# Only the wave components are saved (a few kB instead of the full grid).
 
+wavesStruct = {}
+wavesStruct['seaState'] = 3
+wavesStruct['beta'] = np.pi
+wavesStruct['xVec'] = np.linspace(0, 849, 850)
+wavesStruct['yVec'] = np.linspace(0, 99, 100)
+wavesStruct['Ts'] = 0.2
+wavesStruct['tVec'] = np.arange(0, 90+wavesStruct['Ts'], wavesStruct['Ts'])
+wavesStruct['U'] = 0
 
+wavesStruct['components'] = createWaveComponents(wavesStruct['seaState'],
+                                                 wavesStruct['beta'],
+                                                 wavesStruct['U'])
+wavesStruct['waveType'] = 'long'
 
+wavesStruct['displayName'] = f"Waves with properties: " \
+                             f"\n   -Sea state: {wavesStruct['seaState']}" \
+                             f"\n   -Significant wave height: {wavesStruct['components']['Hs']} m" \
+                             f"\n   -{wavesStruct['waveType']} crested" \
+                             f"\n   -Main wave direction (beta): {wavesStruct['beta']} rad" \
+                             f"\n   -xVec: {wavesStruct['xVec'][0]}:{1}:{wavesStruct['xVec'][-1]} m" \
+                             f"\n   -yVec: {wavesStruct['yVec'][0]}:{1}:{wavesStruct['yVec'][-1]} m" \
+                             f"\n   -tVec: {1}:{wavesStruct['Ts']}:{wavesStruct['tVec'][-1]} s" \
+                             f"\n   -U: {wavesStruct['U']} m/s"
 
-
-
-
-
-
-
+saveWavesFile(wavesStruct)
@@ -18,6 +18,5 @@ def createSpectrum(seaState, wVec):
     B = 3.11 / (Hs**2)    # eq (8.55) in Fossen
     specType = 1  # Bretschneider (@ Fossen pg 203)
     S = wavespec(specType, [A, B], wVec, 0)
-    S[0] = 0 # the first element is NaN for some reason
     return S
     
\ No newline at end of file
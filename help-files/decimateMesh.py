@@ -0,0 +1,45 @@
+import numpy as np
+
+def decimateMesh(vertices, cellSizes):
+    '''
+    DECIMATEMESH Coarser versions of a triangle mesh by vertex clustering.
+    The vertices (three consecutive ones per triangle, as from stlreadOwn)
+    are welded once, then for every cell size they are binned in cubic
+    cells of that size and every cell is replaced by the mean of its
+    vertices. Triangles with two corners in the same cell collapse and are
+    dropped, as are triangles of (numerically) zero area and the repeats of
+    a triangle with the same corners and orientation. The orientation of
+    the kept triangles, and with it the direction of their normals, is
+    unchanged.
+    Output:
+      - meshes: list with the decimated mesh of every cell size, three
+                consecutive vertices per triangle.
+    '''
+    corners = np.asarray(vertices, dtype=np.float64)
+    corners = corners[:len(corners) - len(corners) % 3]
+    welded, triangles = np.unique(corners, axis=0, return_inverse=True)
+    triangles = triangles.reshape((-1, 3))
+    return [clusterMesh(welded, triangles, cellSize) for cellSize in cellSizes]
+
+def clusterMesh(welded, triangles, cellSize):
+    # Vertex clustering of decimateMesh for one cell size, on the welded
+    # vertices and the triangles (F, 3) of their indices
+    cells = np.floor((welded - welded.min(axis=0)) / cellSize).astype(np.int64)
+    _, clusters = np.unique(cells, axis=0, return_inverse=True)
+    clusters = clusters.reshape(-1)
+    counts = np.bincount(clusters)
+    centers = np.stack([np.bincount(clusters, welded[:, i]) for i in range(3)], axis=1) / counts[:, None]
+
+    triangles = clusters[triangles]
+    triangles = triangles[(triangles[:, 0] != triangles[:, 1]) & (triangles[:, 1] != triangles[:, 2]) &
+                          (triangles[:, 2] != triangles[:, 0])]
+    # Rotate the smallest index first, which keeps the orientation, so
+    # repeats of a triangle are equal rows
+    first = np.argmin(triangles, axis=1)
+    triangles = np.take_along_axis(triangles, (first[:, None] + np.arange(3)) % 3, axis=1)
+    triangles = np.unique(triangles, axis=0)
+
+    P = centers[triangles]
+    doubleAreas = np.linalg.norm(np.cross(P[:, 1] - P[:, 0], P[:, 2] - P[:, 0]), axis=1)
+    P = P[doubleAreas > 1e-12 * cellSize**2]
+    return P.reshape((-1, 3))
@@ -0,0 +1,100 @@
+import numpy as np
+from wavespec import wavespec
+from spread import spread
+
+def createFftComponents(Hs, beta, U, xVec, yVec, muVec = [], dmu = 0):
+    # CREATEFFTCOMPONENTS Places the Bretschneider spectrum (and the
+    # directional spreading for short-crested seas) on the wavenumber grid of
+    # the uniform grid xVec, yVec with random phases, so that every time frame
+    # is one inverse 2-D FFT (see fftElevation).
+    # Inputs:
+    #   - Hs:         significant wave height [m].
+    #   - beta:       direction of main wave in rad.
+    #   - U:          speed of the ship [m/s].
+    #   - xVec, yVec: uniformly spaced grid vectors, a ValueError is raised
+    #                 otherwise.
+    #   - muVec, dmu: as in simulateWaves, only used to tell short-crested
+    #                 (muVec ~= []) from long-crested seas. The directions of
+    #                 the FFT sea are the directions of the wavenumber grid.
+    # Ouput:
+    #   - components: dict with the complex amplitudes 'spectrum' and the
+    #                 encounter frequencies 'encounterFrequencies', both of
+    #                 size (length(yVec), length(xVec)), and 'beta', 'U', 'Hs'.
+    # The sea is deep-water (w^2 = g*k) and periodic over the grid, and only
+    # frequencies resolved by the grid are present: from the fundamental
+    # 2*pi/(N*dx) up to the Nyquist wavenumber pi/dx. Long-crested energy is
+    # put on the one-cell wide ray of wavenumbers along the main direction and
+    # scaled to the spectral variance of the resolved band.
+    g = 9.81
+    xVec = np.asarray(xVec, dtype=np.float64)
+    yVec = np.asarray(yVec, dtype=np.float64)
+    dx = xVec[1] - xVec[0]
+    dy = yVec[1] - yVec[0]
+    if not (np.allclose(np.diff(xVec), dx) and np.allclose(np.diff(yVec), dy)):
+        raise ValueError('The FFT method needs uniformly spaced xVec and yVec.')
+    kx = 2 * np.pi * np.fft.fftfreq(len(xVec), dx)
+    ky = 2 * np.pi * np.fft.fftfreq(len(yVec), dy)
+    dkx = 2 * np.pi / (len(xVec) * dx)
+    dky = 2 * np.pi / (len(yVec) * dy)
+    KX, KY = np.meshgrid(kx, ky)
+    k = np.hypot(KX, KY)
+    w = np.sqrt(g * k)
+    valid = k > 0
+
+    # Bretschneider spectrum, same constants as createWaveComponents
+    A = 8.1 * 1e-3 * g**2
+    B = 3.11 / (Hs**2) if Hs != 0 else 999999999999999
+    S = np.zeros(k.shape)
+    S[valid] = wavespec(1, [A, B], w[valid], 0)
+    dwdk = np.zeros(k.shape)
+    dwdk[valid] = g / (2 * w[valid])
+
+    # Angle of every wavevector relative to the main direction of propagation
+    theta = np.arctan2(KY, KX)
+    mu = np.angle(np.exp(1j * (theta + beta)))
+    if len(muVec) > 0:  # Short-crested
+        # S(w)*D(mu)*dw*dmu written in wavenumbers: dw*dmu = dw/dk/k*dkx*dky
+        variance = np.zeros(k.shape)
+        variance[valid] = S[valid] * dwdk[valid] * spread(mu[valid]) / k[valid] * dkx * dky
+    else:  # Long-crested
+        onRay = valid & (np.cos(mu) > 0) & (k * np.abs(np.sin(mu)) <= min(dkx, dky) / 2)
+        variance = np.where(onRay, S * dwdk, 0)
+        if np.any(variance > 0):
+            wBand = np.linspace(w[onRay].min(), w[onRay].max(), 2000)
+            SBand = wavespec(1, [A, B], wBand, 0)
+            m0 = np.sum((SBand[1:] + SBand[:-1]) / 2 * np.diff(wBand))
+            variance *= m0 / variance.sum()
+
+    phases = 2 * np.pi * np.random.rand(len(yVec), len(xVec))
+    # Shift the origin of the FFT grid to (xVec(1), yVec(1))
+    spectrum = np.sqrt(2 * variance) * np.exp(1j * (phases + KX * xVec[0] + KY * yVec[0]))
+    components = {
+        'spectrum': spectrum,
+        'encounterFrequencies': KX * U - w,
+        'beta': beta,
+        'U': U,
+        'Hs': Hs
+    }
+    return components
+
+def fftElevation(components, tVec, maxMemory = 2**28):
+    # FFTELEVATION Wave heights of size (length(yVec), length(xVec),
+    # length(tVec)) from FFT components, one inverse 2-D FFT per time frame.
+    # Only the non-zero wavenumbers are advanced in time (long-crested seas
+    # fill a single ray of the grid) and frames are computed in blocks that
+    # fit maxMemory bytes.
+    spectrum = components['spectrum']
+    ny, nx = spectrum.shape
+    nonZero = np.flatnonzero(spectrum)
+    amplitudes = spectrum.ravel()[nonZero]
+    frequencies = components['encounterFrequencies'].ravel()[nonZero]
+    tVec = np.asarray(tVec, dtype=np.float64).ravel()
+    waves = np.empty((ny, nx, len(tVec)))
+    tBlock = int(max(1, maxMemory // (3 * 16 * ny * nx)))
+    for t0 in range(0, len(tVec), tBlock):
+        t = tVec[t0:t0 + tBlock]
+        frames = np.zeros((len(t), ny * nx), dtype=np.complex128)
+        frames[:, nonZero] = amplitudes * np.exp(1j * np.outer(t, frequencies))
+        frames = np.fft.ifft2(frames.reshape((len(t), ny, nx)), axes=(1, 2))
+        waves[:, :, t0:t0 + tBlock] = np.moveaxis(frames.real * (ny * nx), 0, -1)
+    return waves
@@ -0,0 +1,49 @@
+import numpy as np
+from waveElevation import waveElevation
+from projectedWaves import sampleProjectedWaves
+
+def getWavesWindow(wavesStruct, xRange = None, yRange = None, tRange = None, maxMemory = 2**28):
+    # GETWAVESWINDOW Returns the part of the wave field inside the given
+    # ranges, for grid and spectral wave structs alike (see loadWavesFile).
+    # Inputs:
+    #   - wavesStruct: dict with 'xVec', 'yVec', 'tVec' and either 'waves',
+    #                  'components' or the projected 'xiVec' and 'wavesXi'.
+    #   - xRange:      [xMin, xMax] in m, None for the whole xVec.
+    #   - yRange:      [yMin, yMax] in m, None for the whole yVec.
+    #   - tRange:      [tMin, tMax] in s, None for the whole tVec.
+    #   - maxMemory:   approximate ceiling in bytes for the temporaries when
+    #                  the window is rebuilt from components.
+    # Ouput:
+    #   - waves:       wave heights of size (length(yVec), length(xVec),
+    #                  length(tVec)) for the window.
+    #   - xVec, yVec, tVec: the grid and time vectors of the window.
+    def inRange(vec, limits):
+        vec = np.asarray(vec)
+        if limits is None:
+            return np.ones(len(vec), dtype=bool)
+        return (vec >= limits[0]) & (vec <= limits[1])
+
+    xMask = inRange(wavesStruct['xVec'], xRange)
+    yMask = inRange(wavesStruct['yVec'], yRange)
+    tMask = inRange(wavesStruct['tVec'], tRange)
+    xVec = np.asarray(wavesStruct['xVec'])[xMask]
+    yVec = np.asarray(wavesStruct['yVec'])[yMask]
+    tVec = np.asarray(wavesStruct['tVec'])[tMask]
+
+    if 'wavesXi' in wavesStruct:
+        x, y = np.meshgrid(xVec, yVec)
+        waves = sampleProjectedWaves(wavesStruct, x, y, np.flatnonzero(tMask))
+        waves = waves.reshape((len(yVec), len(xVec), len(tVec)))
+    elif 'components' in wavesStruct:
+        x, y = np.meshgrid(xVec, yVec)
+        waves = waveElevation(wavesStruct['components'], x, y, tVec, maxMemory)
+        waves = waves.reshape((len(yVec), len(xVec), len(tVec)))
+    elif len(xVec) == 0 or len(yVec) == 0 or len(tVec) == 0:
+        waves = np.zeros((len(yVec), len(xVec), len(tVec)))
+    else:
+        # The masks are contiguous, slicing keeps memory maps lazy
+        xIdx = np.flatnonzero(xMask)
+        yIdx = np.flatnonzero(yMask)
+        tIdx = np.flatnonzero(tMask)
+        waves = wavesStruct['waves'][yIdx[0]:yIdx[-1] + 1, xIdx[0]:xIdx[-1] + 1, tIdx[0]:tIdx[-1] + 1]
+    return waves, xVec, yVec, tVec
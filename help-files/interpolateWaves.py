@@ -0,0 +1,38 @@
+import numpy as np
+
+def interpolationWeights(vec, v, name):
+    # Index i of the interval vec[i] <= v <= vec[i+1] of every value in v and
+    # the weight of vec[i+1]. vec must be increasing, its spacing may vary.
+    # Raises an error for values outside vec.
+    v = np.asarray(v, dtype=np.float64)
+    if len(vec) < 2:
+        raise ValueError(f'Interpolation needs at least two samples in {name}.')
+    if v.size and (v.min() < vec[0] or v.max() > vec[-1]):
+        raise IndexError(f'The hull left the waves grid: {name} {v.min():.2f}:{v.max():.2f} is outside '
+                         f'{vec[0]:.2f}:{vec[-1]:.2f}. Use a larger grid or a procedural sea with a sea window.')
+    i = np.clip(np.searchsorted(vec, v, side='right') - 1, 0, len(vec) - 2)
+    w = (v - vec[i]) / (vec[i + 1] - vec[i])
+    return i, w
+
+def interpolateWaves(wavesStruct, x, y, t):
+    '''
+    INTERPOLATEWAVES Wave heights of a waves grid at the points (x, y) at
+    time t, bilinear in x and y and linear in t. Unlike the nearest-cell
+    lookup it works for any spacing of 'xVec', 'yVec' and 'tVec' (also non
+    uniform), so seas can be generated on a coarse grid with a coarse time
+    step and still give smooth forces. Only the two time slices around t are
+    read, which keeps it cheap for memory-mapped waves.
+    Output:
+      - eta: wave heights, same shape as x.
+    '''
+    xi, wx = interpolationWeights(np.ravel(wavesStruct['xVec']), x, 'x')
+    yi, wy = interpolationWeights(np.ravel(wavesStruct['yVec']), y, 'y')
+    ti, wt = interpolationWeights(np.ravel(wavesStruct['tVec']), t, 't')
+    waves = wavesStruct['waves']
+    eta = np.zeros(np.shape(x))
+    for dt, ft in ((0, 1 - wt), (1, wt)):
+        if ft == 0:
+            continue
+        eta += ft * ((1 - wy) * ((1 - wx) * waves[yi, xi, ti + dt] + wx * waves[yi, xi + 1, ti + dt]) +
+                     wy * ((1 - wx) * waves[yi + 1, xi, ti + dt] + wx * waves[yi + 1, xi + 1, ti + dt]))
+    return eta
@@ -0,0 +1,89 @@
+import os
+import numpy as np
+import scipy.io as sio
+
+def loadWavesFile(wavesFile):
+    # LOADWAVESFILE Loads a waves file saved by demoSimulateWaves.saveWavesFile
+    # and returns a dict with the fields 'waves', 'beta', 'xVec', 'yVec',
+    # 'tVec', 'Ts' and 'displayName'.
+    # If the waves are stored in a .npy file (streamed with simulateWaves'
+    # outFile, or written by saveWavesNpy/convertWavesFile), the .mat file
+    # only holds the path in 'wavesFile' and 'waves' is returned as a
+    # read-only memory map with the usual (y, x, t) indexing. Nothing of the
+    # field is read until it is indexed, and since the file is time-major a
+    # simulation step only reads the pages of one time slice around the hull.
+    # Spectral wave files (saved with 'components' instead of 'waves') are
+    # returned with 'components' and no 'waves'. simulateShip then evaluates
+    # them at the hull and getWavesWindow rebuilds any part of the grid.
+    # Projected long-crested files are returned with 'xiVec', 'wavesXi' and
+    # 'direction' (see projectedWaves.py).
+    wavesData = sio.loadmat(wavesFile)['wavesStruct']
+    wavesStruct = {
+        'beta': wavesData['beta'][0, 0],
+        'xVec': wavesData['xVec'][0, 0][0],
+        'yVec': wavesData['yVec'][0, 0][0],
+        'tVec': wavesData['tVec'][0, 0][0],
+        'Ts': wavesData['Ts'][0, 0][0, 0],
+        'displayName': wavesData['displayName'][0, 0][0]
+    }
+    if 'wavesXi' in wavesData.dtype.names:
+        wavesStruct['xiVec'] = wavesData['xiVec'][0, 0][0]
+        wavesStruct['wavesXi'] = wavesData['wavesXi'][0, 0]
+        wavesStruct['direction'] = wavesData['direction'][0, 0][0, 0]
+    elif 'components' in wavesData.dtype.names:
+        wavesStruct['components'] = componentsFromMat(wavesData['components'][0, 0])
+    elif 'wavesFile' in wavesData.dtype.names:
+        npyFile = wavesData['wavesFile'][0, 0][0]
+        if not os.path.isfile(npyFile):
+            # The files were moved together, look next to the .mat file
+            npyFile = os.path.join(os.path.dirname(os.path.abspath(wavesFile)), os.path.basename(npyFile))
+        wavesStruct['waves'] = np.load(npyFile, mmap_mode='r').transpose(1, 2, 0)
+    else:
+        wavesStruct['waves'] = wavesData['waves'][0, 0]
+    return wavesStruct
+
+def componentsFromMat(componentsData):
+    # Converts the wave components struct read by loadmat back into the dict
+    # created by createWaveComponents.
+    components = {}
+    for name in componentsData.dtype.names:
+        value = componentsData[name][0, 0]
+        components[name] = value.ravel() if value.size > 1 else value.ravel()[0]
+    for name in ['frequencies', 'wavenumbers', 'directions', 'amplitudes', 'phases']:
+        components[name] = np.atleast_1d(components[name])
+    return components
+
+def saveWavesNpy(waves, npyFile, maxMemory = 2**28):
+    # Writes a wave grid of size (length(yVec), length(xVec), length(tVec))
+    # to the time-major .npy file npyFile, in time slabs of at most maxMemory
+    # bytes. Returns the file as a read-only memory map with (y, x, t)
+    # indexing, like simulateWaves' outFile.
+    ny, nx, nt = waves.shape
+    fileWaves = np.lib.format.open_memmap(npyFile, mode='w+', dtype=np.float64, shape=(nt, ny, nx))
+    tSlab = int(max(1, maxMemory // (8 * max(ny * nx, 1))))
+    for t0 in range(0, nt, tSlab):
+        fileWaves[t0:t0 + tSlab] = np.moveaxis(waves[:, :, t0:t0 + tSlab], -1, 0)
+    fileWaves.flush()
+    del fileWaves
+    return np.load(npyFile, mmap_mode='r').transpose(1, 2, 0)
+
+def convertWavesFile(wavesFile, npyFile = None):
+    # Converts a waves file that holds the 'waves' grid into one with a .npy
+    # sidecar: the grid is written to npyFile (default: wavesFile with the
+    # extension .npy, see saveWavesNpy) and wavesFile is rewritten with the
+    # other fields and the path in 'wavesFile'. Afterwards loadWavesFile maps
+    # the grid instead of decoding it. Files without a 'waves' grid are left
+    # as they are. Returns the path of the .npy file (or None).
+    wavesData = sio.loadmat(wavesFile)['wavesStruct']
+    if 'waves' not in wavesData.dtype.names:
+        return None
+    if npyFile is None:
+        npyFile = os.path.splitext(wavesFile)[0] + '.npy'
+    saveWavesNpy(wavesData['waves'][0, 0], npyFile)
+    wavesStruct = {name: wavesData[name][0, 0] for name in wavesData.dtype.names if name != 'waves'}
+    wavesStruct['wavesFile'] = os.path.abspath(npyFile)
+    # Write next to the original first so an interrupted conversion keeps it
+    tmpFile = f'{wavesFile}.{os.getpid()}.tmp.mat'
+    sio.savemat(tmpFile, {'wavesStruct': wavesStruct})
+    os.replace(tmpFile, wavesFile)
+    return npyFile
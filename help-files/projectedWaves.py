@@ -0,0 +1,68 @@
+import numpy as np
+from waveElevation import waveElevation
+
+def isLongCrested(components):
+    # ISLONGCRESTED True if all wave components travel in the same direction,
+    # i.e. the field only depends on x and y through x*cos(mu) + y*sin(mu).
+    directions = np.atleast_1d(components['directions'])
+    return len(directions) > 0 and np.all(directions == directions[0])
+
+def createProjectedWaves(components, x, y, tVec, pointsPerWavelength = 32, maxMemory = 2**28):
+    # CREATEPROJECTEDWAVES Synthesises a long-crested sea once on the 1-D axis
+    # xi = x*cos(mu) + y*sin(mu) along the direction of propagation mu.
+    # Inputs:
+    #   - components:          long-crested wave components (see
+    #                          createWaveComponents in simulateWaves.py).
+    #   - x, y:                points (or grid vectors) the axis must cover.
+    #   - tVec:                time vector.
+    #   - pointsPerWavelength: samples per shortest wavelength on the axis.
+    #                          Linear interpolation then has a relative error
+    #                          of at most (pi/pointsPerWavelength)^2/2, about
+    #                          0.5% for the default of 32.
+    #   - maxMemory:           see waveElevation.
+    # Ouput:
+    #   - projected: dict with 'xiVec' (uniform axis), 'wavesXi' of size
+    #                (length(xiVec), length(tVec)) and 'direction' (mu).
+    # Cost and storage are O(length(xiVec)*length(tVec)) instead of
+    # O(length(x)*length(y)*length(tVec)).
+    if not isLongCrested(components):
+        raise ValueError('Projected waves need a long-crested sea (all components in one direction).')
+    mu = np.atleast_1d(components['directions'])[0]
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # The extremes of the projection are attained at the corners of the box
+    corners = np.array([[x.min(), y.min()], [x.min(), y.max()], [x.max(), y.min()], [x.max(), y.max()]])
+    xi = corners[:, 0] * np.cos(mu) + corners[:, 1] * np.sin(mu)
+    kMax = np.max(components['wavenumbers'])
+    dxi = 2 * np.pi / kMax / pointsPerWavelength if kMax > 0 else 1.0
+    nXi = int(np.ceil((xi.max() - xi.min()) / dxi)) + 2
+    xiVec = xi.min() + dxi * np.arange(nXi)
+    wavesXi = waveElevation(components, xiVec * np.cos(mu), xiVec * np.sin(mu), tVec, maxMemory)
+    projected = {
+        'xiVec': xiVec,
+        'wavesXi': wavesXi,
+        'direction': mu
+    }
+    return projected
+
+def sampleProjectedWaves(projected, x, y, tIdx = slice(None), clampOutside = False):
+    # SAMPLEPROJECTEDWAVES Linearly interpolates projected waves at the points
+    # (x, y). Returns an array of size (P,) for an integer tIdx, otherwise
+    # (P, number of selected times). Raises an error for points whose
+    # projection is outside xiVec, unless clampOutside is true: they then get
+    # the nearest end sample, which is only meant for display.
+    xiVec = projected['xiVec']
+    mu = projected['direction']
+    xi = np.ravel(x) * np.cos(mu) + np.ravel(y) * np.sin(mu)
+    pos = (xi - xiVec[0]) / (xiVec[1] - xiVec[0])
+    # Round-off of the projection at the ends of the axis is tolerated
+    if not clampOutside and pos.size and (pos.min() < -1e-9 or pos.max() > len(xiVec) - 1 + 1e-9):
+        raise IndexError(f'The hull left the waves grid: xi {xi.min():.2f}:{xi.max():.2f} is outside '
+                         f'{xiVec[0]:.2f}:{xiVec[-1]:.2f}. Use a larger grid or a procedural sea with a sea window.')
+    pos = np.clip(pos, 0, len(xiVec) - 1)
+    idx = np.minimum(pos.astype(int), len(xiVec) - 2)
+    w = pos - idx
+    wavesXi = projected['wavesXi'][:, tIdx]
+    if wavesXi.ndim == 2:
+        w = w[:, None]
+    return (1 - w) * wavesXi[idx] + w * wavesXi[idx + 1]
@@ -0,0 +1,83 @@
+import numpy as np
+from waveElevation import waveElevation, spatialFactors, factorElevation
+
+def createSeaWindow(components, tVec, margin = 20, slabLength = 32, maxMemory = 2**28):
+    '''
+    CREATESEAWINDOW Moving sea window for a procedural sea: the wave grid is
+    only generated in a box around the ship's footprint, for slabLength time
+    steps at a time, and the box is moved when the hull gets out of it. The
+    transit length then drives neither memory nor generation time.
+    Inputs:
+      - components: wave components (see createWaveComponents).
+      - tVec:       time vector of the simulation.
+      - margin:     number of grid cells added around the footprint when the
+                    box is placed, so it is not moved every step.
+      - slabLength: number of time steps generated at once.
+      - maxMemory:  see waveElevation.
+    Ouput:
+      - window: dict with the box ('x0', 'y0' first cell, 'waves' of size
+                (ny, nx, number of slab times), 't0' first time index of the
+                slab) and the settings. Read it with seaWindowHeights.
+    The box uses the cells of a 1 m grid on xVec = yVec = 0, 1, 2, ..., with
+    the same nearest-cell lookup as a wave file, so a run through the window
+    gives the same states as on that (unbounded) grid.
+    '''
+    window = {
+        'components': components,
+        'tVec': np.asarray(tVec, dtype=np.float64),
+        'margin': margin,
+        'slabLength': slabLength,
+        'maxMemory': maxMemory,
+        'x0': 0,
+        'y0': 0,
+        'waves': None,
+        't0': None,
+        'factors': None,
+        'moves': 0
+    }
+    return window
+
+def seaWindowHeights(window, facePoints, tIdx):
+    '''
+    SEAWINDOWHEIGHTS Wave heights at the face points (..., 3) at time index
+    tIdx. Places (or moves) the box when a face point falls outside it and
+    generates the next slab when tIdx passes the current one. Time indices
+    must be read in increasing order.
+    '''
+    xIdx = np.rint(facePoints[..., 0]).astype(int) - 1
+    yIdx = np.rint(facePoints[..., 1]).astype(int) - 1
+    waves = window['waves']
+    if (waves is None or xIdx.min() < window['x0'] or yIdx.min() < window['y0'] or
+            xIdx.max() >= window['x0'] + waves.shape[1] or yIdx.max() >= window['y0'] + waves.shape[0]):
+        placeSeaWindow(window, xIdx, yIdx, tIdx)
+    elif tIdx >= window['t0'] + waves.shape[2]:
+        fillSeaWindow(window, tIdx)
+    return window['waves'][yIdx - window['y0'], xIdx - window['x0'], tIdx - window['t0']]
+
+def placeSeaWindow(window, xIdx, yIdx, tIdx):
+    # Centers the box on the cells xIdx, yIdx plus the margin and fills it
+    # from time index tIdx
+    margin = window['margin']
+    window['x0'] = xIdx.min() - margin
+    window['y0'] = yIdx.min() - margin
+    nx = xIdx.max() - xIdx.min() + 1 + 2 * margin
+    ny = yIdx.max() - yIdx.min() + 1 + 2 * margin
+    x, y = np.meshgrid(window['x0'] + np.arange(nx), window['y0'] + np.arange(ny))
+    window['grid'] = (x, y)
+    window['factors'] = None
+    if 2 * x.size * len(window['components']['amplitudes']) * 8 <= window['maxMemory'] // 2:
+        # The spatial part is the same for every slab of this box
+        window['factors'] = spatialFactors(window['components'], x, y)
+    window['moves'] += 1
+    fillSeaWindow(window, tIdx)
+
+def fillSeaWindow(window, tIdx):
+    # Generates the slab of the box starting at time index tIdx
+    x, y = window['grid']
+    t = window['tVec'][tIdx:tIdx + window['slabLength']]
+    if window['factors'] is not None:
+        slab = factorElevation(window['components'], window['factors'], t)
+    else:
+        slab = waveElevation(window['components'], x, y, t, window['maxMemory'] // 2)
+    window['waves'] = slab.reshape(x.shape + (len(t),))
+    window['t0'] = tIdx
@@ -0,0 +1,61 @@
+import numpy as np
+from multiprocessing import shared_memory
+
+def shareWaves(wavesStruct):
+    '''
+    SHAREWAVES Publishes the wave grid of a loaded wavesStruct (see
+    loadWavesFile) once for worker processes, which attach to it with
+    attachWaves instead of each decoding the .mat file into its own copy.
+    Waves already memory-mapped from a streamed .npy file are shared through
+    the file (the OS page cache), all other grids are copied once into a
+    shared memory block.
+    Output:
+      - sharedStruct: picklable dict with the fields of wavesStruct, but
+                      'waves' replaced by 'sharedWaves', {'shm': name,
+                      'shape': shape, 'dtype': dtype} or {'wavesFile': path}.
+                      Only this small dict is sent to the workers;
+      - shm:          the shared memory block, or None for a memory map. The
+                      caller must close() and unlink() it when the workers
+                      are done.
+    Structs without a 'waves' grid (spectral or projected) are returned
+    unchanged with shm = None.
+    '''
+    waves = wavesStruct.get('waves')
+    if waves is None:
+        return wavesStruct, None
+    sharedStruct = {name: value for name, value in wavesStruct.items() if name != 'waves'}
+    if isinstance(waves, np.memmap):
+        # Time-major .npy file, attachWaves maps it again read-only
+        sharedStruct['sharedWaves'] = {'wavesFile': waves.filename}
+        return sharedStruct, None
+    waves = np.asarray(waves)
+    shm = shared_memory.SharedMemory(create=True, size=max(1, waves.nbytes))
+    sharedWaves = np.ndarray(waves.shape, dtype=waves.dtype, buffer=shm.buf)
+    sharedWaves[...] = waves
+    del sharedWaves
+    sharedStruct['sharedWaves'] = {'shm': shm.name, 'shape': waves.shape, 'dtype': waves.dtype.str}
+    return sharedStruct, shm
+
+def attachWaves(sharedStruct):
+    '''
+    ATTACHWAVES Rebuilds in a worker process the wavesStruct published with
+    shareWaves. 'waves' is a read-only view of the shared memory block or of
+    the memory-mapped file, nothing is copied.
+    Output:
+      - wavesStruct: as returned by loadWavesFile;
+      - shm:         the attached shared memory block (None for a memory
+                     map), it must stay referenced while 'waves' is used.
+    Structs without 'sharedWaves' are returned unchanged with shm = None.
+    '''
+    if 'sharedWaves' not in sharedStruct:
+        return sharedStruct, None
+    wavesStruct = {name: value for name, value in sharedStruct.items() if name != 'sharedWaves'}
+    target = sharedStruct['sharedWaves']
+    if 'wavesFile' in target:
+        wavesStruct['waves'] = np.load(target['wavesFile'], mmap_mode='r').transpose(1, 2, 0)
+        return wavesStruct, None
+    shm = shared_memory.SharedMemory(name=target['shm'])
+    waves = np.ndarray(target['shape'], dtype=np.dtype(target['dtype']), buffer=shm.buf)
+    waves.flags.writeable = False
+    wavesStruct['waves'] = waves
+    return wavesStruct, shm
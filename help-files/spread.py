@@ -0,0 +1,7 @@
+import numpy as np
+
+def spread(mu):
+    # SPREAD Directional spreading function (2/pi)*cos(mu)^2 on [-pi/2, pi/2]
+    # and 0 outside, evaluated elementwise.
+    mu = np.asarray(mu)
+    return np.where((mu >= -np.pi/2) & (mu <= np.pi/2), (2/np.pi)*np.cos(mu)**2, 0)
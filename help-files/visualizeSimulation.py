@@ -1,13 +1,29 @@
 from R import R
 from mayavi import mlab
 import numpy as np
+from waveElevation import waveElevation
+from loadWavesFile import componentsFromMat
+from projectedWaves import sampleProjectedWaves
 
-def visualizeSimulation(states, waves, xVec, yVec, tVec, faces, vertices, cogVec):
+def visualizeSimulation(states, waves, xVec, yVec, tVec, faces, vertices, cogVec, wavesTVec = None):
+    # waves is either the (y, x, t) grid of wave heights or a dict of wave
+    # components or projected waves, in which case every frame is rebuilt on
+    # the grid. wavesTVec is the time vector of the waves if it is not tVec
+    # (interpolated simulations), the nearest frame is then shown.
     # Create a figure
     mlab.figure()
     vertices = np.array(vertices, dtype=np.float64)
     faces = np.array(faces, dtype=np.int32) -1
     xVec, yVec = np.meshgrid(xVec, yVec)
+    def waveFrame(t):
+        if wavesTVec is not None:
+            t = int(np.argmin(np.abs(np.ravel(wavesTVec) - np.ravel(tVec)[t])))
+        if isinstance(waves, dict) and 'wavesXi' in waves:
+            # The grid around the track may reach past the projected axis
+            return sampleProjectedWaves(waves, xVec, yVec, t, clampOutside=True).reshape(xVec.shape)
+        if isinstance(waves, dict):
+            return waveElevation(waves, xVec, yVec, [np.ravel(tVec)[t]])[:, 0].reshape(xVec.shape)
+        return waves[:, :, t]
     ## Create the ship mesh
     p = mlab.triangular_mesh(vertices[:, 0], vertices[:, 1], vertices[:, 2], faces,
                              color=(0.8, 0.8, 1.0), representation='surface')
@@ -17,7 +33,7 @@ def visualizeSimulation(states, waves, xVec, yVec, tVec, faces, vertices, cogVec
     p.actor.property.specular_power = 5
 
     # Create the sea surface
-    sea = mlab.mesh(xVec, yVec, waves[:, :, 0])
+    sea = mlab.mesh(xVec, yVec, waveFrame(0))
 
     # Set the axes limits and labels
     mlab.axes(xlabel='x [m]', ylabel='y [m]', zlabel='z [m]',
@@ -34,7 +50,7 @@ def visualizeSimulation(states, waves, xVec, yVec, tVec, faces, vertices, cogVec
     def anim(deltaX,deltaY,deltaZ):
         for t in range(1, len(tVec[0])-1):
             # Update the sea surface
-            sea.mlab_source.set(z=waves[:, :, t])
+            sea.mlab_source.set(z=waveFrame(t))
             # Update the ship position and orientation
             deltaX += states[0, t] - states[0, t - 1]
             deltaY += states[1, t] - states[1, t - 1]
@@ -58,12 +74,24 @@ visualFile =    f'{os.getcwd()}/simulation-results/Simulation_6_Result_visualize
 visualData = sio.loadmat(visualFile)
 
 states = visualData['states']
-waves = visualData['waves']
+if 'wavesXi' in visualData:
+    # Projected long-crested sea, frames are interpolated from the 1-D field
+    waves = {'xiVec': visualData['xiVec'][0], 'wavesXi': visualData['wavesXi'],
+             'direction': visualData['direction'][0, 0]}
+elif 'components' in visualData:
+    # Procedural or spectral sea, frames are rebuilt from the components
+    waves = componentsFromMat(visualData['components'])
+elif 'wavesFile' in visualData:
+    # Waves streamed to a .npy file, memory-map it with (y, x, t) indexing
+    waves = np.load(visualData['wavesFile'][0], mmap_mode='r').transpose(1, 2, 0)
+else:
+    waves = visualData['waves']
 xVec = visualData['xVec']
 yVec = visualData['yVec']
 tVec = visualData['tVec']
 faces = visualData['faces']
 vertices = visualData['vertices']
 cogVec = visualData['cogVec']
+wavesTVec = visualData.get('wavesTVec')
 
-visualizeSimulation(states, waves, xVec, yVec, tVec, faces, vertices, cogVec)
+visualizeSimulation(states, waves, xVec, yVec, tVec, faces, vertices, cogVec, wavesTVec)
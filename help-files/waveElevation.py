@@ -0,0 +1,141 @@
+import numpy as np
+
+def waveElevation(components, x, y, t, maxMemory = 2**28):
+    # WAVEELEVATION Sums the contribution of all wave components at the points
+    # (x, y) for all times in t.
+    # Inputs:
+    #   - components: dict created by createWaveComponents (simulateWaves.py)
+    #                 with the flattened component arrays 'amplitudes',
+    #                 'wavenumbers', 'directions', 'frequencies', 'phases'
+    #                 and the ship speed 'U'.
+    #   - x, y:       coordinates of the P points, same shape.
+    #   - t:          time vector of length T.
+    #   - maxMemory:  approximate ceiling in bytes for the temporary arrays.
+    # Ouput:
+    #   - eta:        array of size (P, T) with the wave heights.
+    #
+    # Each component is amp*cos(k*((x+U*t)*cos(mu) + y*sin(mu)) - w*t + e).
+    # The phase splits into a spatial part s = k*(x*cos(mu) + y*sin(mu)) + e
+    # and a temporal part (k*U*cos(mu) - w)*t, so with the angle sum identity
+    # the sum over components becomes two matrix products:
+    #   eta = (amp*cos(s)) @ cos(W*t) - (amp*sin(s)) @ sin(W*t)
+    # which is evaluated over blocks of points and times that fit maxMemory.
+    x = np.asarray(x, dtype=np.float64).ravel()
+    y = np.asarray(y, dtype=np.float64).ravel()
+    t = np.asarray(t, dtype=np.float64).ravel()
+    amp = components['amplitudes']
+    k = components['wavenumbers']
+    mu = components['directions']
+    cosMu = np.cos(mu)
+    sinMu = np.sin(mu)
+    W = k * components['U'] * cosMu - components['frequencies']
+
+    nC = len(amp)
+    eta = np.zeros((len(x), len(t)))
+    if nC == 0 or len(x) == 0 or len(t) == 0:
+        return eta
+
+    # Every block holds about four (points x components), two (components x
+    # times) and one (points x times) float64 arrays.
+    budget = max(maxMemory // 8, 1)
+    tBlock = int(min(len(t), max(1, budget // (4 * nC))))
+    pBlock = int(min(len(x), max(1, (budget - 2 * nC * tBlock) // (4 * nC + tBlock))))
+    for t0 in range(0, len(t), tBlock):
+        Wt = np.outer(W, t[t0:t0 + tBlock])
+        cosWt = np.cos(Wt)
+        sinWt = np.sin(Wt)
+        for p0 in range(0, len(x), pBlock):
+            s = k * (np.outer(x[p0:p0 + pBlock], cosMu) +
+                     np.outer(y[p0:p0 + pBlock], sinMu)) + components['phases']
+            eta[p0:p0 + pBlock, t0:t0 + tBlock] = (amp * np.cos(s)) @ cosWt - (amp * np.sin(s)) @ sinWt
+    return eta
+
+def spatialFactors(components, x, y):
+    # Returns amp*cos(s) and amp*sin(s), both (P, components), of the
+    # spatial phase s at the points (x, y) (see waveElevation). With them the
+    # elevation at any times t is factorElevation(components, factors, t).
+    x = np.asarray(x, dtype=np.float64).ravel()
+    y = np.asarray(y, dtype=np.float64).ravel()
+    s = components['wavenumbers'] * (np.outer(x, np.cos(components['directions'])) +
+                                     np.outer(y, np.sin(components['directions']))) + components['phases']
+    return components['amplitudes'] * np.cos(s), components['amplitudes'] * np.sin(s)
+
+def factorElevation(components, factors, t):
+    # Wave heights (P, T) at the points of the spatial factors for all times
+    # in t: ampCos @ cos(W*t) - ampSin @ sin(W*t).
+    W = components['wavenumbers'] * components['U'] * np.cos(components['directions']) - components['frequencies']
+    Wt = np.outer(W, np.asarray(t, dtype=np.float64).ravel())
+    return factors[0] @ np.cos(Wt) - factors[1] @ np.sin(Wt)
+
+def createWaveStepper(components, t0, Ts, renormEvery = 64):
+    # CREATEWAVESTEPPER Time-marching state of the wave components. Instead of
+    # evaluating cos/sin(W*t) at every sample, each component keeps the
+    # complex phasor exp(1i*W*t), which is advanced by one step Ts with a
+    # complex multiplication by the precomputed exp(1i*W*Ts). Every
+    # renormEvery steps the phasors are scaled back to unit length so that
+    # round-off does not make the amplitudes drift.
+    W = components['wavenumbers'] * components['U'] * np.cos(components['directions']) - components['frequencies']
+    stepper = {
+        'phasors': np.exp(1j * W * t0),
+        'stepPhasors': np.exp(1j * W * Ts),
+        'renormEvery': renormEvery,
+        'steps': 0,
+        't': t0,
+        'Ts': Ts
+    }
+    return stepper
+
+def advanceWaveStepper(stepper):
+    # ADVANCEWAVESTEPPER Advances the phasors of a wave stepper by one step Ts.
+    stepper['phasors'] *= stepper['stepPhasors']
+    stepper['steps'] += 1
+    stepper['t'] += stepper['Ts']
+    if stepper['steps'] % stepper['renormEvery'] == 0:
+        stepper['phasors'] /= np.abs(stepper['phasors'])
+
+def stepperElevation(components, stepper, x, y):
+    # STEPPERELEVATION Wave heights at the points (x, y) at the current time
+    # of the stepper: real(sum(amp*exp(1i*s) .* phasors)) with the spatial
+    # phase s as in waveElevation.
+    x = np.asarray(x, dtype=np.float64).ravel()
+    y = np.asarray(y, dtype=np.float64).ravel()
+    s = components['wavenumbers'] * (np.outer(x, np.cos(components['directions'])) +
+                                     np.outer(y, np.sin(components['directions']))) + components['phases']
+    return (np.cos(s) @ (components['amplitudes'] * stepper['phasors'].real) -
+            np.sin(s) @ (components['amplitudes'] * stepper['phasors'].imag))
+
+def marchWaves(components, x, y, tVec, renormEvery = 64, maxMemory = 2**28):
+    # MARCHWAVES Same output as waveElevation, (P, T), for a uniformly spaced
+    # tVec, with the temporal factors produced by time marching (see
+    # createWaveStepper) instead of cos/sin evaluations. The spatial factors
+    # are computed once per block of points and reused for all times.
+    x = np.asarray(x, dtype=np.float64).ravel()
+    y = np.asarray(y, dtype=np.float64).ravel()
+    t = np.asarray(tVec, dtype=np.float64).ravel()
+    amp = components['amplitudes']
+    nC = len(amp)
+    eta = np.zeros((len(x), len(t)))
+    if nC == 0 or len(x) == 0 or len(t) == 0:
+        return eta
+    Ts = t[1] - t[0] if len(t) > 1 else 0.0
+    if len(t) > 2 and not np.allclose(np.diff(t), Ts):
+        raise ValueError('Time marching needs a uniformly spaced time vector.')
+
+    budget = max(maxMemory // 8, 1)
+    tBlock = int(min(len(t), max(1, budget // (4 * nC))))
+    pBlock = int(min(len(x), max(1, (budget - 2 * nC * tBlock) // (4 * nC + tBlock))))
+    stepper = createWaveStepper(components, t[0], Ts, renormEvery)
+    mu = components['directions']
+    for t0 in range(0, len(t), tBlock):
+        nT = min(tBlock, len(t) - t0)
+        phasors = np.empty((nC, nT), dtype=np.complex128)
+        for j in range(nT):
+            phasors[:, j] = stepper['phasors']
+            advanceWaveStepper(stepper)
+        ampCos = amp[:, None] * phasors.real
+        ampSin = amp[:, None] * phasors.imag
+        for p0 in range(0, len(x), pBlock):
+            s = components['wavenumbers'] * (np.outer(x[p0:p0 + pBlock], np.cos(mu)) +
+                                             np.outer(y[p0:p0 + pBlock], np.sin(mu))) + components['phases']
+            eta[p0:p0 + pBlock, t0:t0 + nT] = np.cos(s) @ ampCos - np.sin(s) @ ampSin
+    return eta
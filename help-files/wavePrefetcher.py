@@ -0,0 +1,89 @@
+import queue
+import threading
+import numpy as np
+from waveElevation import waveElevation, spatialFactors, factorElevation
+
+def createWavePrefetcher(wavesStruct, slabLength = 32, depth = 2, maxMemory = 2**28):
+    '''
+    CREATEWAVEPREFETCHER Starts a background thread that loads (memory-mapped
+    or in-memory 'waves') or synthesises (spectral 'components' with 'xVec'
+    and 'yVec') the wave grid in slabs of slabLength time steps and puts
+    them in a queue of at most depth slabs. The simulation reads the time
+    slices with prefetchedSlice while the next slabs are produced, so the
+    wall-clock time of a run approaches the larger of wave production and
+    ship stepping instead of their sum, and at most depth + 1 slabs are held
+    in memory. NumPy releases the GIL in the file reads and in the products
+    of waveElevation, so a thread is enough for the two to overlap.
+    Output:
+      - prefetcher: dict with the 'queue', the 'thread', the current 'slab'
+                    (length(yVec), length(xVec), slabLength) and its first
+                    time index 't0'. Stop it with closePrefetcher.
+    '''
+    if 'waves' not in wavesStruct and not ('components' in wavesStruct and 'xVec' in wavesStruct):
+        raise ValueError('Prefetching needs a waves grid or components with xVec and yVec.')
+    prefetcher = {
+        'queue': queue.Queue(maxsize=depth),
+        'stop': threading.Event(),
+        'slab': None,
+        't0': None
+    }
+    prefetcher['thread'] = threading.Thread(target=produceSlabs, args=(prefetcher, wavesStruct, slabLength, maxMemory),
+                                            daemon=True)
+    prefetcher['thread'].start()
+    return prefetcher
+
+def produceSlabs(prefetcher, wavesStruct, slabLength, maxMemory):
+    # Producer thread of createWavePrefetcher. Errors are handed to the
+    # consumer through the queue.
+    tVec = wavesStruct['tVec']
+    try:
+        factors = None
+        if 'waves' not in wavesStruct:
+            x, y = np.meshgrid(wavesStruct['xVec'], wavesStruct['yVec'])
+            if 2 * x.size * len(wavesStruct['components']['amplitudes']) * 8 <= maxMemory:
+                # The spatial part is the same for every slab
+                factors = spatialFactors(wavesStruct['components'], x, y)
+        for t0 in range(0, len(tVec), slabLength):
+            if prefetcher['stop'].is_set():
+                return
+            if 'waves' in wavesStruct:
+                slab = np.array(wavesStruct['waves'][:, :, t0:t0 + slabLength])
+            else:
+                t = tVec[t0:t0 + slabLength]
+                if factors is not None:
+                    slab = factorElevation(wavesStruct['components'], factors, t)
+                else:
+                    slab = waveElevation(wavesStruct['components'], x, y, t, maxMemory)
+                slab = slab.reshape(x.shape + (len(t),))
+            putSlab(prefetcher, (t0, slab))
+    except Exception as error:
+        putSlab(prefetcher, (None, error))
+
+def putSlab(prefetcher, item):
+    # Blocks while the queue is full, but gives up when the prefetcher is
+    # closed
+    while not prefetcher['stop'].is_set():
+        try:
+            prefetcher['queue'].put(item, timeout=0.1)
+            return
+        except queue.Full:
+            pass
+
+def prefetchedSlice(prefetcher, tIdx):
+    '''
+    PREFETCHEDSLICE Wave grid (length(yVec), length(xVec)) at time index
+    tIdx. The time indices must be read in increasing order; slabs that are
+    passed are dropped.
+    '''
+    while prefetcher['slab'] is None or tIdx >= prefetcher['t0'] + prefetcher['slab'].shape[2]:
+        t0, slab = prefetcher['queue'].get()
+        if t0 is None:
+            raise slab
+        prefetcher['t0'], prefetcher['slab'] = t0, slab
+    return prefetcher['slab'][:, :, tIdx - prefetcher['t0']]
+
+def closePrefetcher(prefetcher):
+    # Stops the producer thread and drops the queued slabs
+    prefetcher['stop'].set()
+    prefetcher['thread'].join()
+    prefetcher['slab'] = None
@@ -1,143 +1,140 @@
+import math
 import numpy as np
 import matplotlib.pyplot as plt
 
 def wavespec(SpecType, Par, W, PlotFlag):
-    S = []
-    if np.ndim(W) == 2:
-        n, = np.shape(W)
-    else:
-        n,m = 1, np.shape(W)[0]
-    if n > m:
-        print('Error: W must be a column vector')
-        return
+    # WAVESPEC Spectral density S(w) of the wave spectrum SpecType at the
+    # frequencies W (rad/s), evaluated as array expressions over W. The
+    # spectra go to 0 for w -> 0, so W may start at 0.
+    # Inputs:
+    #   - SpecType: 1 Bretschneider (A, B), 2 Pierson-Moskowitz (Vwind20),
+    #               3 ITTC-Modified Pierson-Moskowitz (Hs, T0), 4 (Hs, T1),
+    #               5 (Hs, Tz), 6 JONSWAP (Vwind10, Fetch), 7 JONSWAP
+    #               (Hs, w0, gamma), 8 Torsethaugen (Hs, w0).
+    #   - Par:      the parameters of SpecType, or a batch of parameter sets
+    #               of size (Nparams, number of parameters), e.g. a sweep
+    #               over Hs and T0.
+    #   - W:        vector of frequencies.
+    #   - PlotFlag: plots the spectra if true.
+    # Output:
+    #   - S:        spectral density, size (length(W),), or (Nparams,
+    #               length(W)) for a batch of parameter sets.
+    W = np.ravel(np.asarray(W, dtype=np.float64))
+    P = np.asarray(Par, dtype=np.float64)
+    isBatch = P.ndim == 2
+    P = np.atleast_2d(P)
+    # Parameter i of every set as a column, broadcast against W
+    par = lambda i: P[:, i, None]
+    g = 9.81
 
-    
     if SpecType == 1:  # Bretschneither
-        A = Par[0]
-        B = Par[1]
-        for k in range(len(W)):
-            Sa = A * W[k]**(-5) * np.exp(-B / (W[k]**4))
-            S.append(Sa)
+        A = par(0)
+        B = par(1)
+        S = peakShape(A, B, W)
         TitleStr = 'Bretschneither Spectrum'
-        L1Str = f'A={A} [m^2 s^{{-4}}], B={B} [s^{{-4}}]'
-    
+        L1Str = 'A={0} [m^2 s^{{-4}}], B={1} [s^{{-4}}]'
+
     elif SpecType == 2:  # Pierson-Moskowitz
-        Vwind20 = Par[0]
+        Vwind20 = par(0)
         A = 8.1e-3 * 9.81**2
         B = 0.74 * (9.81 / Vwind20)**4
-        for k in range(len(W)):
-            Sa = A * W[k]**(-5) * np.exp(-B / (W[k]**4))
-            S.append(Sa)
+        S = peakShape(A, B, W)
         TitleStr = 'Pierson-Moskowitz Spectrum'
-        L1Str = f'Vwind @20m ASL = {Vwind20} [m/s]'
+        L1Str = 'Vwind @20m ASL = {0} [m/s]'
 
     elif SpecType == 3:  # ITTC-Modified Pierson-Moskowitz (Hs, T0)
-        Hs = Par[0]
-        T0 = Par[1]
+        Hs = par(0)
+        T0 = par(1)
         A = 487 * Hs**2 / T0**4
         B = 1949 / T0**4
-        for k in range(len(W)):
-            Sa = A * W[k]**(-5) * np.exp(-B / (W[k]**4))
-            S.append(Sa)
+        S = peakShape(A, B, W)
         TitleStr = 'ITTC-Modified Pierson-Moskowitz Spectrum'
-        L1Str = f'Hs = {Hs} [m], T0 = {T0} [s]'
+        L1Str = 'Hs = {0} [m], T0 = {1} [s]'
     elif SpecType == 4:  # ITTC-Modified Pierson-Moskowitz (Hs, T1)
-        Hs = Par[0]
-        T1 = Par[1]
+        Hs = par(0)
+        T1 = par(1)
         A = 173 * Hs**2 / T1**4
         B = 691 / T1**4
-        for k in range(len(W)):
-            Sa = A * W[k]**(-5) * np.exp(-B / (W[k]**4))
-            S.append(Sa)
+        S = peakShape(A, B, W)
         TitleStr = 'ITTC-Modified Pierson-Moskowitz Spectrum'
-        L1Str = f'Hs = {Hs} [m], T1 = {T1} [s]'
+        L1Str = 'Hs = {0} [m], T1 = {1} [s]'
     elif SpecType == 5:  # ITTC-Modified Pierson-Moskowitz (Hs, Tz)
-        Hs = Par[0]
-        Tz = Par[1]
+        Hs = par(0)
+        Tz = par(1)
         A = 123 * Hs**2 / Tz**4
         B = 495 / Tz**4
-        for k in range(len(W)):
-            Sa = A * W[k]**(-5) * np.exp(-B / (W[k]**4))
-            S.append(Sa)
+        S = peakShape(A, B, W)
         TitleStr = 'ITTC-Modified Pierson-Moskowitz Spectrum'
-        L1Str = f'Hs = {Hs} [m], Tz = {Tz} [s]'
+        L1Str = 'Hs = {0} [m], Tz = {1} [s]'
     elif SpecType == 6:  # JONSWAP (Vwind10, Fetch)
-        Vw10 = Par[0]
-        fetch = Par[1]
-        g = 9.81
+        Vw10 = par(0)
+        fetch = par(1)
         xtilde = g * fetch / (Vw10**2)
         f0 = 3.5 * (g / Vw10) * xtilde**-0.33
         w0 = 2 * np.pi * f0
         alpha = 0.076 * xtilde**-0.22
-        for k in range(len(W)):
-            if W[k] < w0:
-                sigma = 0.07
-            else:
-                sigma = 0.09
-            S1 = alpha * g**2 * (W[k]**-5) * np.exp(-(5 / 4) * (w0 / W[k])**4)
-            S2 = 3.3**(np.exp(-(W[k] - w0)**2 / (2 * (sigma * w0)**2)))
-            Sa = S1 * S2
-            S.append(Sa)
+        sigma = np.where(W < w0, 0.07, 0.09)
+        S1 = peakShape(alpha * g**2, (5 / 4) * w0**4, W)
+        S2 = 3.3**(np.exp(-(W - w0)**2 / (2 * (sigma * w0)**2)))
+        S = S1 * S2
         TitleStr = 'JONSWAP Spectrum'
-        L1Str = f'Vwind @10m ASL = {Vw10} [m/s], Fetch = {fetch / 1000} [km]'
+        L1Str = 'Vwind @10m ASL = {0} [m/s], Fetch = {1} [m]'
     elif SpecType == 7: #JONSWAP (gamma, Hs, w0)
-        Hs = Par[0]
-        w0 = Par[1]
-        gamma = Par[2]
-        g = 9.81
+        Hs = par(0)
+        w0 = par(1)
+        gamma = par(2)
         alpha = 0.2 * (Hs**2) * (w0**4) / g**2
-        if gamma < 1 or gamma > 7:
-            if gamma != 0:
-                # Display warning if gamma is outside validity range and not
-                # set to zero
-                print('Warning: gamma value in wave_spectrum function outside validity range, using DNV formula')
-            k = 2 * (np.pi) / (w0*Hs**0.5)
-            if k<= 3.6:
-                gamma = 5
-            elif k<= 5.0:
-                gamma = np.exp(5.75 - 1.15*k)
-            else:
-                gamma = 1
-        for k in range(len(W)):
-            if W[k] < w0:
-                sigma = 0.07
-            else:
-                sigma = 0.09
-            S1 = alpha * g**2 * (W[k]**-5) * np.exp(-(5 / 4) * (w0 / W[k])**4)
-            S2 = gamma**(np.exp(-(W[k] - w0)**2 / (2 * (sigma * w0)**2)))
-            Conv_factor = 1-0.287*np.log(gamma)
-            Sa = S1 * S2 * Conv_factor
-            S.append(Sa) 
+        outside = (gamma < 1) | (gamma > 7)
+        if np.any(outside & (gamma != 0)):
+            # Display warning if gamma is outside validity range and not
+            # set to zero
+            print('Warning: gamma value in wave_spectrum function outside validity range, using DNV formula')
+        k = 2 * (np.pi) / (w0*Hs**0.5)
+        gammaDnv = np.where(k <= 3.6, 5, np.where(k <= 5.0, np.exp(5.75 - 1.15*k), 1))
+        gamma = np.where(outside, gammaDnv, gamma)
+        P = np.concatenate((P[:, :2], gamma), axis=1)
+        sigma = np.where(W < w0, 0.07, 0.09)
+        S1 = peakShape(alpha * g**2, (5 / 4) * w0**4, W)
+        S2 = gamma**(np.exp(-(W - w0)**2 / (2 * (sigma * w0)**2)))
+        Conv_factor = 1-0.287*np.log(gamma)
+        S = S1 * S2 * Conv_factor
         TitleStr = 'JONSWAP Spectrum'
-        L1Str = f'gamma = {gamma} , Hs = {Hs}, [m], w0 = {w0} [rad/s]'
+        L1Str = 'Hs = {0} [m], w0 = {1} [rad/s], gamma = {2}'
     elif SpecType == 8: # Torsethaugen (Hs, w0)
-        Hs = Par[0]
-        w0 = Par[1]
-        N = len(W)
-        wmax = np.max(W)
-        S = torset_spec(Hs, w0, W)  # See function below
+        S = np.array([torset_spec(Hs, w0, W) for Hs, w0 in P[:, :2]])  # See function below
         TitleStr = 'Torsethaugen Spectrum'
-        L1Str = f'Hs = {Hs} [m], w0 = {w0} [rad/s]'
+        L1Str = 'Hs = {0} [m], w0 = {1} [rad/s]'
     else:
         print('Wrong spectrum type identifier, SpecType=1,2,..,8')
         return
-    
+    S = np.broadcast_to(S, (len(P), len(W)))
+
     if PlotFlag:
-        plt.plot(W, S, 'r', linewidth=1)
+        plt.plot(W, S.T, 'r', linewidth=1)
         plt.title(TitleStr)
-        plt.legend([L1Str])
+        plt.legend([L1Str.format(*parameters) for parameters in P])
         plt.xlabel('ω [rad/s]')
         plt.ylabel('S(ω) [m^2 s]')
         plt.show()
-    return S
+    return np.array(S) if isBatch else S[0].copy()
+
+def peakShape(A, B, W, n = 5, m = 4):
+    # PEAKSHAPE A*W^-n*exp(-B/W^m), broadcast over the parameters A, B and
+    # the frequencies W. Only evaluated where the exponential does not
+    # underflow, elsewhere (and at W = 0) it is the limit 0 instead of NaN.
+    with np.errstate(divide='ignore', over='ignore'):
+        E = B / (W**m)
+    valid = E < 745
+    Wv = np.where(valid, W, 1)
+    return np.where(valid, A * Wv**(-n) * np.exp(-np.where(valid, E, 0)), 0)
 
 def torset_spec(Hs,wo,omg):
 #
-# The Torsethaugen spectrum is an empirical two peaked spectrum for swell and 
+# The Torsethaugen spectrum is an empirical two peaked spectrum for swell and
 # developing sea based on experimental data from the North Sea. For small peak
 # frequencies, i.e.  0 < wmax <= 0.6 only one peak in the spectrum appears.
-# Returns the spectral density function S of the Torsethaugen spectrum for 
-# the frequencies:  0 < w < wmax (rad/s).
+# Returns the spectral density function S of the Torsethaugen spectrum for
+# the frequencies:  0 <= w < wmax (rad/s).
 #
 # Ouputs:
 #   S     	- vector of power spectral densities (m^2s)
@@ -150,7 +147,7 @@ def torset_spec(Hs,wo,omg):
 # Ref: K.Torsethaugen (1996): "Model for a Doubly Peaked Wave Spectra"
 #      Sintef report no.: STF22 A96204 prepared for Norsk Hydro.
 #
-# Author:     G. Kleiven, Norsk Hydro 
+# Author:     G. Kleiven, Norsk Hydro
 # Date:       2000-06-15
 # Revisions:  2001-07-06,Svein I. Sagatun, Norsk Hydro - minor revisions
 #             2001-10-14,Thor I. Fossen - IO compatible with the GNC toolbox
@@ -160,10 +157,9 @@ def torset_spec(Hs,wo,omg):
 #---------------------------------------------------------------------------
 # source code: Norsk Hydro
 #---------------------------------------------------------------------------
+    omg = np.asarray(omg, dtype=np.float64)
     Tp = 2 * np.pi / wo  # peak period (s)
     f2pii = 2 * np.pi
-    fwtp = f2pii / Tp
-    Nfrq = len(omg)
 
     # Hs must be positive
     if Hs > 0:
@@ -210,46 +206,8 @@ def torset_spec(Hs,wo,omg):
             ms = mw
             if ms < 1:
                 ms = 1
-            g_argw = (nw -1)/mw
-            g_args = (ns -1)/ms
-            if g_args < 0:
-                g0s = 1.0/((1.0/ms)*np.euler_gamma(g_args)*((ns/ms)**(-g_args)))
-            else:
-                g0s = 1.0/((1.0/ms)*np.euler_gamma(g_args)/((ns/ms)**(-g_args)))
-            if g_argw < 0:
-                g0w = 1.0/((1.0/mw)*np.euler_gamma(g_argw)*((nw/mw)**(-g_argw)))
-            else:
-                g0w = 1.0/((1.0/mw)*np.euler_gamma(g_argw)/((nw/mw)**(-g_argw)))
-            a1m = 4.1
-            b1m = 2.0*(mw**0.28)-5.3
-            c1m = -1.45*(mw**0.1)+0.96
-            a2m = 2.2/(mw**3.3)+0.57
-            b2m = -0.58*mw**0.37+0.53
-            c2m = -1.04/(mw**1.9)+0.94
-            if c1m < 0:
-                f1w = a1m / (nw-b1m)**(-c1m)
-            else:
-                f1w = a1m * (nw-b1m)**c1m
-            if b2m < 0:
-                f2w = a2m / nw**(-b2m) + c2m
-            else:
-                f2w = a2m * nw**(b2m) + c2m
-            b1m = 2.0*(ms**0.28)-5.3
-            c1m = -1.45*(ms**0.1)+0.96
-            a2m = 2.2/(ms**3.3)+0.57
-            b2m = -0.58*ms**0.37+0.53
-            c2m = -1.04/(ms**1.9)+0.94
-            if c1m < 0:
-                f1s = a1m / (ns-b1m)**(-c1m)
-            else:
-                f1s = a1m * (ns-b1m)**c1m
-            if b2m < 0:
-                f2s = a2m / ns**(-b2m) + c2m
-            else:
-                f2s = a2m * ns**(b2m) + c2m
-            
-            agammaw = (1+f1w*np.log(gammaw)^(f2w))/gammaw
-            agammas = (1+f1s*np.log(gammas)^(f2s))/gammas
+            g0w = torset_g0(nw, mw)
+            g0s = torset_g0(ns, ms)
         else:
             #----------------------------------------------------------------------------------------------------------------
             # Predominant swell peak:
@@ -265,53 +223,18 @@ def torset_spec(Hs,wo,omg):
             nw = ns
             mw = m0*(1-b2*np.exp(-Hs/b3))
             s4 = s0*(1-np.exp(-Hs/s1))
-            g_argw = (nw-1)/mw
-            g_args = (ns-1)/ms
-            if g_args < 0:
-                g0s = 1./((1./ms)*np.euler_gamma(g_args)*((ns/ms)**(-g_args)))
-            else:
-                g0s = 1./((1./ms)*np.euler_gamma(g_args)/((ns/ms)**(g_args)))
-            if g_argw < 0:
-                g0w = 1./((1./mw)*np.euler_gamma(g_argw)*((nw/mw)**(-g_argw)))
-            else:
-                g0w = 1./((1./mw)*np.euler_gamma(g_argw)/((nw/mw)**(g_argw)))
+            g0w = torset_g0(nw, mw)
+            g0s = torset_g0(ns, ms)
             tpw = ((g0w*hsw**2)/(16*s4*(0.4**nw)))**(1./(nw-1.))
             sf = ((f2pii/9.81)*Hs/(tf**2))
             gammaw = 1.
             gamma_f = kg*(1+kg0*np.exp(-Hs/kg1))*sf**r
             gammas = gamma_f*(1.+a3*epsu)
-            a1m = 4.1
-            b1m = 2.0*(mw**0.28)-5.3
-            c1m = -1.45*(mw**0.1)+0.96
-            a2m = 2.2/(mw**3.3)+0.57
-            b2m = -0.58*(mw**0.37)+0.53
-            c2m = -1.04/(mw**1.9)+0.94
-            if c1m < 0:
-                f1w = a1m / (nw-b1m)**(-c1m)
-            else:
-                f1w = a1m * (nw-b1m)**c1m
-            if b2m < 0:
-                f2w = a2m / nw**(-b2m) + c2m
-            else:
-                f2w = a2m * nw**(b2m) + c2m
-            b1m = 2.0*(ms**0.28)-5.3
-            c1m = -1.45*(ms**0.1)+0.96
-            a2m = 2.2/(ms**3.3)+0.57
-            b2m = -0.58*(ms**0.37)+0.53
-            c2m = -1.04/(ms**1.9)+0.94
-            if c1m < 0:
-                f1s = a1m / (ns-b1m)**(-c1m)
-            else:
-                f1s = a1m * (ns-b1m)**c1m
-            if b2m < 0:
-                f2s = a2m / ns**(-b2m) + c2m
-            else:
-                f2s = a2m * ns**(b2m) + c2m
-            agammaw = (1+f1w*np.log(gammaw)**(f2w))/gammaw
-            agammas = (1+f1s*np.log(gammas)**(f2s))/gammas
-        
-        fdenorm_s = (tps-(hss**2))/16
-        fdenorm_w = (tpw-(hsw**2))/16
+        agammaw = torset_agamma(gammaw, nw, mw)
+        agammas = torset_agamma(gammas, ns, ms)
+
+        fdenorm_s = (tps*(hss**2))/16
+        fdenorm_w = (tpw*(hsw**2))/16
 
         #==================================================================
         # Estimates spectral density for each frequency in array omg:
@@ -322,27 +245,17 @@ def torset_spec(Hs,wo,omg):
         #Wind sea contribution:
         #-------------------------------------------------------------------
         fnw = f * tpw
-        in_val = np.max(np.where(fnw < 1))
-        ftest1 = np.zeros(Nfrq)
-        ftest1[:in_val] = np.exp(-(((fnw[:in_val] - 1) ** 2) / sigma_a2))
-        ftest1[in_val:Nfrq] = np.exp(-(((fnw[in_val:Nfrq] - 1) ** 2) / sigma_b2))
+        ftest1 = np.exp(-(((fnw - 1) ** 2) / np.where(fnw < 1, sigma_a2, sigma_b2)))
         gamma_wf = np.power(gammaw, ftest1)
-        gamma_ws_1 = np.power(fnw, -nw)
-        gamma_ws_2 = np.exp(-(nw / mw) * np.power(fnw, -mw))
-        gamma_ws = gamma_ws_1 * gamma_ws_2
+        gamma_ws = peakShape(1, nw / mw, fnw, nw, mw)
         sw = g0w * agammaw * gamma_ws * gamma_wf * fdenorm_w / (2 * np.pi)
         #-------------------------------------------------------------------
         #Swell contribution:
         #-------------------------------------------------------------------
         fns = f * tps
-        is_val = np.max(np.where(fns < 1))
-        ftest2 = np.zeros(Nfrq)
-        ftest2[:is_val] = np.exp(-(((fns[:is_val] - 1) ** 2) / sigma_a2))
-        ftest2[is_val:Nfrq] = np.exp(-(((fns[is_val:Nfrq] - 1) ** 2) / sigma_b2))
+        ftest2 = np.exp(-(((fns - 1) ** 2) / np.where(fns < 1, sigma_a2, sigma_b2)))
         gamma_sf = np.power(gammas, ftest2)
-        gamma_ss_1 = np.power(fns, -ns)
-        gamma_ss_2 = np.exp(-(ns / ms) * np.power(fns, -ms))
-        gamma_ss = gamma_ss_1 * gamma_ss_2
+        gamma_ss = peakShape(1, ns / ms, fns, ns, ms)
         ss = g0s * agammas * gamma_ss * gamma_sf * fdenorm_s / (2 * np.pi)
         #-----------------------------------------------------------------------------
         #Estimates spectral-density Sf(m^2*s)
@@ -351,7 +264,24 @@ def torset_spec(Hs,wo,omg):
     else:
         S = np.zeros(len(omg))
     # Check that the output is real, if not the input is beyond the validity range
-    if np.sum(np.imag(S)) != 0:
+    if not np.all(np.isfinite(S)):
         S = np.zeros(np.shape(omg))
         print('Torsethaugen spectrum input outside validity range in wave_spectrum, complex output set to zero')
-    return S.T
\ No newline at end of file
+    return S
+
+def torset_g0(n, m):
+    # Normalising factor G0 of the Torsethaugen spectral shape f^-n exp(-(n/m) f^-m)
+    g_arg = (n - 1) / m
+    return 1. / ((1. / m) * math.gamma(g_arg) / ((n / m)**g_arg))
+
+def torset_agamma(gamma, n, m):
+    # Correction A_gamma of the Torsethaugen peak enhancement gamma
+    a1m = 4.1
+    b1m = 2.0*(m**0.28)-5.3
+    c1m = -1.45*(m**0.1)+0.96
+    a2m = 2.2/(m**3.3)+0.57
+    b2m = -0.58*(m**0.37)+0.53
+    c2m = -1.04/(m**1.9)+0.94
+    f1 = a1m * (n-b1m)**c1m
+    f2 = a2m * n**b2m + c2m
+    return (1+f1*np.log(gamma)**f2)/gamma
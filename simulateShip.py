@@ -2,6 +2,7 @@ import numpy as np
 from scipy.signal import cont2discrete as c2d
 import os
 import sys
+import hashlib
 import scipy.io as sio
 
 
@@ -20,50 +21,805 @@ sys.path.append(boatPath)
 # Append the relative path to the help-files folder
 help_files_path = os.path.join(current_dir, 'help-files')
 sys.path.append(help_files_path)
-from areaOfFace import areaOfFace
 from stlreadOwn import stlreadOwn
+from loadWavesFile import loadWavesFile
+from waveElevation import waveElevation, createWaveStepper, advanceWaveStepper, stepperElevation
+from projectedWaves import sampleProjectedWaves
+from wavePrefetcher import createWavePrefetcher, prefetchedSlice, closePrefetcher
+from seaWindow import createSeaWindow, seaWindowHeights
+from interpolateWaves import interpolationWeights, interpolateWaves
 from R import R
+from decimateMesh import decimateMesh
 # Suppress/hide the warning
 np.seterr(invalid='ignore')
 
 # Help functions
 def calculatePointsAreasNormals(V):
     # Returns facepoints which are the center of the triangles, the
-    # triangles' areas and the normals to the triangles.
-    j = 0
-    facePoints = []
-    faceAreas = []
-    normals = []
-    for i in range(0, len(V)-2, 3):
-        facePoints.append([np.mean(V[i:i+3, 0]), np.mean(V[i:i+3, 1]), np.mean(V[i:i+3, 2])])
-        faceAreas.append(areaOfFace(V[i:i+3, 0], V[i:i+3, 1], V[i:i+3, 2]))
-        p0 = V[i, :].T
-        p1 = V[i+1, :].T
-        p2 = V[i+2, :].T
-        n = np.cross(p0-p1, p0-p2) / np.linalg.norm(np.cross(p0-p1, p0-p2))
-        normals.append(-n)  # The normal of the face
-    facePoints = np.array(facePoints)
-    faceAreas = np.array(faceAreas)
-    normals = np.array(normals)
+    # triangles' areas and the normals to the triangles, for all triangles
+    # at once. V holds three consecutive vertices per triangle.
+    P = V[:len(V) - len(V) % 3].reshape((-1, 3, 3))
+    facePoints = P.mean(axis=1)
+    c = np.cross(P[:, 0] - P[:, 1], P[:, 0] - P[:, 2])
+    cNorm = np.linalg.norm(c, axis=1)
+    faceAreas = 0.5 * cNorm
+    normals = -c / cNorm[:, None]  # The normal of the face
     return facePoints, faceAreas, normals
-def T(phi, th):
-  # Gustafsson, "Statistical Sensor Fusion" 3rd edition
-  # Eq. (13.9), p. 349
-  T = [[1, np.sin(phi)*np.tan(th), np.cos(phi)*np.tan(th)],
-        [0, np.cos(phi), -np.sin(phi)],
-        [0, np.sin(phi)/np.cos(th), np.cos(phi)/np.cos(th)]]
-  return T
-
-def pRegulator(Kp, refValue, currentValue):
-    # Simple P-control of speed.
-    regulation = Kp * (refValue - currentValue)
-    return regulation
+
+def loadHull(shipStruct, cacheDir = None):
+    # Loads the ship's STL file, places it at shipStruct['verticesPos'] and
+    # returns the dict hull with 'faces', 'vertices', 'facePoints',
+    # 'faceAreas', 'normals', 'cog' (including cogOffset) and 'bbox' (min and
+    # max corner of the vertices). The result is cached on disk as an .npz
+    # file keyed by the hash of the STL contents, verticesPos and cogOffset,
+    # so repeated runs with the same hull skip the preprocessing. The cache
+    # lives in cacheDir, by default shipStruct['hullCache'] or
+    # <repo>/hull-cache; shipStruct['hullCache'] = False disables it.
+    if cacheDir is None:
+        cacheDir = shipStruct.get('hullCache', os.path.join(current_dir, 'hull-cache'))
+    verticesPos = np.asarray(shipStruct['verticesPos'], dtype=np.float64)
+    cogOffset = np.asarray(shipStruct['cogOffset'], dtype=np.float64)
+    cacheFile = None
+    if cacheDir:
+        cacheFile = os.path.join(cacheDir, f'hull_{hullCacheKey(shipStruct).hexdigest()}.npz')
+        if os.path.isfile(cacheFile):
+            with np.load(cacheFile) as cached:
+                return {name: cached[name] for name in cached.files}
+
+    faces, vertices, _ = stlreadOwn(shipStruct['file'])
+    vertices += verticesPos
+    bbox = np.array([np.min(vertices, axis=0), np.max(vertices, axis=0)])
+    cog = np.array((bbox[1] + bbox[0]) / 2, dtype=np.float32)
+    cog = cog + cogOffset
+    facePoints, faceAreas, normals = calculatePointsAreasNormals(vertices)
+    hull = {
+        'faces': faces,
+        'vertices': vertices,
+        'facePoints': facePoints,
+        'faceAreas': faceAreas,
+        'normals': normals,
+        'cog': cog,
+        'bbox': bbox
+    }
+    if cacheFile is not None:
+        os.makedirs(cacheDir, exist_ok=True)
+        # Write to a temporary file first so parallel runs never read a half-written cache
+        tmpFile = f'{cacheFile}.{os.getpid()}.tmp.npz'
+        np.savez(tmpFile, **hull)
+        os.replace(tmpFile, cacheFile)
+    return hull
+
+def hullCacheKey(shipStruct):
+    # SHA-256 hash of the STL contents, verticesPos and cogOffset of a ship,
+    # the key of its files in the hull cache (see loadHull)
+    key = hashlib.sha256()
+    with open(shipStruct['file'], 'rb') as fid:
+        for block in iter(lambda: fid.read(2**20), b''):
+            key.update(block)
+    key.update(np.asarray(shipStruct['verticesPos'], dtype=np.float64).tobytes())
+    key.update(np.asarray(shipStruct['cogOffset'], dtype=np.float64).tobytes())
+    return key
+
+def gridIndices(facePoints, shape):
+    # Nearest cell (yIdx, xIdx) of the face points in a waves grid of the
+    # given shape (ny, nx, ...). Raises an error when the hull is (partly)
+    # outside the grid, instead of wrapping around with negative indices.
+    xIdx = np.rint(facePoints[..., 0]).astype(int) - 1
+    yIdx = np.rint(facePoints[..., 1]).astype(int) - 1
+    if xIdx.min() < 0 or yIdx.min() < 0 or xIdx.max() >= shape[1] or yIdx.max() >= shape[0]:
+        raise IndexError(f'The hull left the waves grid: it covers the cells x {xIdx.min()}:{xIdx.max()}, '
+                         f'y {yIdx.min()}:{yIdx.max()} of a {shape[1]}x{shape[0]} grid. Use a larger grid or '
+                         'a procedural sea with a sea window.')
+    return yIdx, xIdx
+
+def isUnitGrid(wavesStruct):
+    # True if the waves grid is on xVec = yVec = 0, 1, 2, ..., the only
+    # grid on which the nearest-cell lookup of gridIndices, which takes the
+    # face coordinates in metres as cell indices, is right
+    return all(np.array_equal(np.ravel(wavesStruct[name]), np.arange(np.size(wavesStruct[name])))
+               for name in ['xVec', 'yVec'])
+
+def sampleWaves(wavesStruct, facePoints, tIdx, waveStepper = None, prefetcher = None, seaWindow = None, t = None):
+    # Returns the wave height at every face point at time index tIdx.
+    # facePoints may be of any shape (..., 3), the heights are then (...).
+    # For a grid of waves: same indexing as the original per-face loop, round
+    # to the nearest grid cell (half to even, like Python's round) and shift
+    # to 0-based indices. For a procedural sea the components are evaluated
+    # directly at the face points, with the same one-cell shift so that the
+    # result agrees with a grid generated on xVec = yVec = 0, 1, 2, ...
+    # If a wave stepper (see createWaveStepper) is given it must be at time
+    # tVec[tIdx]; its marched phasors then replace the cos/sin of time.
+    # Projected long-crested waves are interpolated at the shifted points.
+    # With a prefetcher (see createWavePrefetcher) the grid slice of tIdx is
+    # taken from its queue, with a sea window (see createSeaWindow) from the
+    # box around the hull.
+    # If the simulation time t is given, a grid or projected sea is
+    # interpolated instead (bilinear in x and y, linear in t, see
+    # interpolateWaves) and tIdx is not used.
+    x = facePoints[..., 0]
+    y = facePoints[..., 1]
+    if t is not None and 'wavesXi' in wavesStruct:
+        tIdx, wt = interpolationWeights(np.ravel(wavesStruct['tVec']), t, 't')
+        heights = sampleProjectedWaves(wavesStruct, x - 1, y - 1, slice(tIdx, tIdx + 2))
+        return ((1 - wt) * heights[:, 0] + wt * heights[:, 1]).reshape(x.shape)
+    if t is not None and 'waves' in wavesStruct:
+        return interpolateWaves(wavesStruct, x - 1, y - 1, t)
+    if seaWindow is not None:
+        return seaWindowHeights(seaWindow, facePoints, tIdx)
+    if prefetcher is not None:
+        grid = prefetchedSlice(prefetcher, tIdx)
+        return grid[gridIndices(facePoints, grid.shape)]
+    if 'wavesXi' in wavesStruct:
+        return sampleProjectedWaves(wavesStruct, x - 1, y - 1, tIdx).reshape(x.shape)
+    if 'components' in wavesStruct and waveStepper is not None:
+        return stepperElevation(wavesStruct['components'], waveStepper, x - 1, y - 1).reshape(x.shape)
+    if 'components' in wavesStruct:
+        t = wavesStruct['tVec'][tIdx]
+        return waveElevation(wavesStruct['components'], x - 1, y - 1, [t])[:, 0].reshape(x.shape)
+    yIdx, xIdx = gridIndices(facePoints, wavesStruct['waves'].shape)
+    return wavesStruct['waves'][yIdx, xIdx, tIdx]
+
+def createBodyHull(hull, clipWaterline = False):
+    # Returns the hull relative to its center of gravity: 'points' (face
+    # points - cog), 'normals', 'normalsAndMoments' (F, 6) with the normals
+    # and the moments cross(points, normals), and 'areas'. The hull is
+    # rigid, so with a pose (rotation matrix P, see statePoses) and the cog
+    # of a ship the earth-fixed face points are points @ P + cog and the
+    # normals normals @ P. Degenerate faces (zero area) get a zero normal
+    # instead of NaN. 'homogeneousPoints' (4, F) are the points as columns
+    # [x; y; z; 1] for posedFacePoints.
+    # With clipWaterline the waves are sampled at the vertices instead and
+    # every triangle is clipped at the water surface (see clippedSums):
+    # the vertices are welded, 'homogeneousPoints' (4, V) holds them and
+    # 'triangles' (F, 3) their indices, 'triangleVertices' (F, 3, 3) the
+    # corners of every face and 'vertexMoments' (F, 3, 6) the force and
+    # moment of a face per unit depth at each of its corners.
+    points = hull['facePoints'] - hull['cog']
+    normals = np.where(hull['faceAreas'][:, None] > 0, hull['normals'], 0)
+    bodyHull = {
+        'points': points,
+        'homogeneousPoints': np.vstack((points.T, np.ones(len(points)))),
+        'normals': normals,
+        # Normals and moments side by side, summed with a single product
+        'normalsAndMoments': np.hstack((normals, np.cross(points, normals))),
+        'areas': hull['faceAreas']
+    }
+    if clipWaterline:
+        corners = hull['vertices'][:3 * len(points)] - hull['cog']
+        vertices, triangles = np.unique(corners, axis=0, return_inverse=True)
+        triangles = triangles.reshape((-1, 3))
+        triangleVertices = vertices[triangles]
+        # A depth d linear over a triangle of area A with corners r gives
+        #   int(d dA) = A/3 * sum(d),  int(d r dA) = A/12 * sum(d_i * (sum(r) + r_i))
+        # so force and moment are linear in the corner depths
+        areas = bodyHull['areas'][:, None, None]
+        levers = triangleVertices.sum(axis=1, keepdims=True) + triangleVertices
+        bodyHull['homogeneousPoints'] = np.vstack((vertices.T, np.ones(len(vertices))))
+        bodyHull['triangles'] = triangles
+        bodyHull['triangleVertices'] = triangleVertices
+        bodyHull['vertexMoments'] = np.concatenate((np.broadcast_to(areas / 3 * normals[:, None, :], levers.shape),
+                                                    areas / 12 * np.cross(levers, normals[:, None, :])), axis=2)
+    return bodyHull
+
+def posedFacePoints(bodyHull, poses, cog):
+    # Earth-fixed face points (N, F, 3) of N ships with poses (N, 3, 3) and
+    # centers of gravity cog (N, 3). points @ pose + cog = [points 1] @
+    # [pose; cog], so all ships are posed by a single (3N, 4) @ (4, F)
+    # product; the result is a view with x, y and z contiguous over faces.
+    n = len(poses)
+    transforms = np.concatenate((poses, cog[:, None, :]), axis=1).transpose(0, 2, 1).reshape((3 * n, 4))
+    posed = (transforms @ bodyHull['homogeneousPoints']).reshape((n, 3, -1))
+    return np.moveaxis(posed, 1, 2)
+
+def hydrostaticForcesAndTorques(bodyHull, poses, facePoints, waveHeights, ro, g):
+    # Returns the net buoyancy force F_net (earth-fixed) and the net torque
+    # Tau_net of N ships at once, all (N, 3). facePoints (N, F, 3) are the
+    # posed face points and waveHeights (N, F) the wave height above each;
+    # poses (N, 3, 3) is R(phi, -th, -psi) of every ship (see statePoses).
+    # A face contributes if the wave is above its center point, with a force
+    # w = ro*g*h*area along its normal. Since the normals and levers of a
+    # ship are the body-frame ones times its pose,
+    #   sum(w*normal) = (w @ normals) @ pose
+    #   sum(cross(lever, w*normal)) = (w @ moments) @ pose
+    # so both sums are one (N, F) @ (F, 6) product with the body-frame arrays.
+    # The torque is wanted in the rotated frame, R(phi, -th, -psi) @ the
+    # earth-fixed sum, which is pose @ pose.T @ (w @ moments) = w @ moments.
+    # Dry faces (h <= 0) are clamped to zero force, in place.
+    # For a clipped hull (see createBodyHull) facePoints and waveHeights are
+    # at the vertices and the wet part of every face is integrated exactly
+    # with clippedSums.
+    # The last points of a hull from deepFaceHull belong to faces that stay
+    # under water, they are summed with 'deepWeights' without the clamp.
+    w = waveHeights - facePoints[..., 2]
+    deepSums = None
+    if 'deepWeights' in bodyHull:
+        nBand = w.shape[1] - len(bodyHull['deepWeights'])
+        deepSums = w[:, nBand:] @ bodyHull['deepWeights']
+        w = w[:, :nBand]
+    if 'triangles' in bodyHull:
+        sums = clippedSums(bodyHull, w)
+    else:
+        np.maximum(w, 0, out=w)
+        w *= bodyHull['areas']
+        sums = w @ bodyHull['normalsAndMoments']
+    if deepSums is not None:
+        sums += deepSums
+    sums *= ro * g
+    F_net = (sums[:, None, 0:3] @ poses)[:, 0, :]
+    Tau_net = sums[:, 3:6]
+    return F_net, Tau_net
+
+def clippedSums(bodyHull, depths):
+    '''
+    CLIPPEDSUMS Force and moment sums (N, 6), per unit ro*g and in the body
+    frame, of the water pressure on a clipped hull (see createBodyHull)
+    with the depths (N, V) of its vertices below the water surface. The
+    depth is linear over every triangle, so its wet part (depth > 0) is
+    integrated exactly instead of counting a face as wholly wet or dry:
+      - all corners wet:  the whole triangle;
+      - one corner wet:   the triangle cut off at that corner by the
+                          waterline, with corners (r_k, p_1, p_2), depths
+                          (d_k, 0, 0) and area A*t_1*t_2, where p_j = r_k
+                          + t_j*(r_j - r_k) and t_j = d_k/(d_k - d_j);
+      - two corners wet:  the whole triangle minus the (negative) integral
+                          over the cut-off triangle at the dry corner.
+    The whole triangles are one (N, 3F) @ (3F, 6) product, only the faces
+    crossing the waterline are clipped one by one.
+    '''
+    n = depths.shape[0]
+    triangles = bodyHull['triangles']
+    wet = (depths > 0).view(np.uint8)
+    wetCorners = wet[:, triangles[:, 0]] + wet[:, triangles[:, 1]] + wet[:, triangles[:, 2]]
+    d = depths[:, triangles]
+    whole = d * (wetCorners >= 2)[:, :, None]
+    sums = whole.reshape((n, -1)) @ bodyHull['vertexMoments'].reshape((-1, 6))
+
+    ship, face = np.nonzero((wetCorners == 1) | (wetCorners == 2))
+    if len(face) > 0:
+        dCut = d[ship, face]
+        oneWet = wetCorners[ship, face] == 1
+        # The corner on its own side of the waterline and the other two
+        k = np.where(oneWet, np.argmax(dCut > 0, axis=1), np.argmax(dCut <= 0, axis=1))
+        rows = np.arange(len(face))
+        corners = bodyHull['triangleVertices'][face]
+        dk = dCut[rows, k]
+        rk = corners[rows, k]
+        weight = np.where(oneWet, 1.0, -1.0) * bodyHull['areas'][face] * dk
+        leverSum = 2 * rk
+        for j in ((k + 1) % 3, (k + 2) % 3):
+            t = dk / (dk - dCut[rows, j])
+            weight *= t
+            leverSum += rk + t[:, None] * (corners[rows, j] - rk)
+        normals = bodyHull['normals'][face]
+        cut = np.hstack((weight[:, None] / 3 * normals, np.cross(weight[:, None] / 12 * leverSum, normals)))
+        np.add.at(sums, ship, cut)
+    return sums
+
+def subsetBodyHull(bodyHull, faces):
+    # The body hull (see createBodyHull) of the faces with indices faces
+    pointFields = ['homogeneousPoints', 'triangles']
+    subset = {name: np.ascontiguousarray(value[faces]) for name, value in bodyHull.items() if name not in pointFields}
+    if 'triangles' in bodyHull:
+        # Only the vertices of these faces, renumbered
+        vertices, triangles = np.unique(bodyHull['triangles'][faces], return_inverse=True)
+        subset['triangles'] = triangles.reshape((-1, 3))
+        subset['homogeneousPoints'] = np.ascontiguousarray(bodyHull['homogeneousPoints'][:, vertices])
+    else:
+        subset['homogeneousPoints'] = np.ascontiguousarray(bodyHull['homogeneousPoints'][:, faces])
+    return subset
+
+def deepFaceHull(bodyHull, bandFaces, deepFaces):
+    '''
+    DEEPFACEHULL Body hull of the faces bandFaces (see subsetBodyHull) with
+    the faces deepFaces, which stay under water, summed in bulk: the points
+    of the deep faces are appended to 'homogeneousPoints' and 'deepWeights'
+    (P, 6) holds the force and moment per unit ro*g*depth at each of them,
+    so their sums are depths @ deepWeights. For a clipped hull the points
+    are the vertices of the deep triangles and the weights their summed
+    'vertexMoments'.
+    '''
+    subset = subsetBodyHull(bodyHull, bandFaces)
+    if 'triangles' in bodyHull:
+        vertices, corners = np.unique(bodyHull['triangles'][deepFaces], return_inverse=True)
+        weights = np.zeros((len(vertices), 6))
+        np.add.at(weights, corners.reshape(-1), bodyHull['vertexMoments'][deepFaces].reshape((-1, 6)))
+        points = bodyHull['homogeneousPoints'][:, vertices]
+    else:
+        weights = bodyHull['areas'][deepFaces, None] * bodyHull['normalsAndMoments'][deepFaces]
+        points = bodyHull['homogeneousPoints'][:, deepFaces]
+    subset['homogeneousPoints'] = np.hstack((subset['homogeneousPoints'], points))
+    subset['deepWeights'] = weights
+    subset['deepFaces'] = deepFaces
+    return subset
+
+def createWetFaceTracker(bodyHull, recheckEvery = 25, margin = 1.0):
+    '''
+    CREATEWETFACETRACKER Narrow-band tracking of the wet faces of a hull.
+    Between two steps the wet/dry status of a face rarely changes: faces
+    well above the highest wave crest cannot get wet and faces well below
+    the lowest trough cannot get dry until the ship has moved. At a full
+    check all faces are posed and sampled and split with
+      band = 0.5*(crest - trough) + margin + recheckEvery * stepMotion
+    into
+      - dry faces,  lowest point above crest + band: skipped;
+      - deep faces, highest point below trough - band: always wet, so the
+                    pressure ro*g*(eta - z) on them is never clamped (or
+                    clipped) and their force and moment are one product of
+                    the depths at their points with fixed weights;
+      - band faces, all others: re-classified every step by the clamp of
+                    hydrostaticForcesAndTorques (or clipped, see
+                    clippedSums),
+    crest and trough being the extreme wave heights at the hull and
+    stepMotion the largest vertical displacement of a hull point per step
+    since the last check. Until the next check only the deep and band faces
+    are posed and sampled. The band thus widens with the waves and the ship
+    motion. A full check is made every recheckEvery steps, and earlier when
+    a hull point may have moved vertically by more than margin +
+    recheckEvery * stepMotion since the last one.
+    Inputs:
+      - bodyHull:     see createBodyHull;
+      - recheckEvery: number of steps between full checks;
+      - margin:       constant part of the band [m].
+    Ouput:
+      - tracker: dict, use with wetFaceHull and updateWetFaces. 'checks'
+                 counts the full checks and 'activeHull' holds the body hull
+                 of the band faces with the points and 'deepWeights' of the
+                 deep faces appended (see deepFaceHull), and the indices of
+                 the deep faces in 'deepFaces'. A face is in the band if it
+                 is for any ship of a batch, deep if it is for all.
+    '''
+    tracker = {
+        'bodyHull': bodyHull,
+        'recheckEvery': recheckEvery,
+        'margin': margin,
+        # Largest distance of a sampled point from the cog
+        'radius': np.max(np.linalg.norm(bodyHull['homogeneousPoints'][0:3], axis=0), initial=0),
+        'activeHull': None,
+        'allowance': 0.0,
+        'stepMotion': 0.0,
+        'steps': 0,
+        'checks': 0,
+        'poseZ': None,
+        'cogZ': None
+    }
+    return tracker
+
+def hullMotion(tracker, poses, cog):
+    # Bound on the vertical displacement of any hull point since the last
+    # full check, |z - z0| <= |cogZ - cogZ0| + radius * |P(:, 2) - P0(:, 2)|
+    return np.max(np.abs(cog[:, 2] - tracker['cogZ']) +
+                  tracker['radius'] * np.linalg.norm(poses[:, :, 2] - tracker['poseZ'], axis=1))
+
+def wetFaceHull(tracker, poses, cog):
+    '''
+    WETFACEHULL Body hull to evaluate at a step with poses (N, 3, 3) and cog
+    (N, 3): the band and deep faces, or the whole hull when a full check is
+    due.
+    After a full check (the returned hull is tracker['bodyHull']) pass the
+    face points and wave heights to updateWetFaces.
+    '''
+    tracker['steps'] += 1
+    if (tracker['activeHull'] is None or tracker['steps'] > tracker['recheckEvery'] or
+            hullMotion(tracker, poses, cog) > tracker['allowance']):
+        return tracker['bodyHull']
+    return tracker['activeHull']
+
+def updateWetFaces(tracker, poses, cog, facePoints, waveHeights):
+    # Full check of wetFaceHull: splits the faces into dry, deep and band
+    # faces from the face points (N, F, 3) and wave heights (N, F) of the
+    # whole hull
+    if tracker['activeHull'] is not None and tracker['steps'] > 1:
+        # Motion per step since the last check, the current step excluded
+        tracker['stepMotion'] = hullMotion(tracker, poses, cog) / (tracker['steps'] - 1)
+    crest = np.max(waveHeights)
+    trough = np.min(waveHeights)
+    tracker['allowance'] = tracker['margin'] + tracker['recheckEvery'] * tracker['stepMotion']
+    band = 0.5 * (crest - trough) + tracker['allowance']
+    zLow = zHigh = facePoints[..., 2]
+    if 'triangles' in tracker['bodyHull']:
+        # Points at the vertices, a face spans from its lowest to its
+        # highest corner
+        corners = zLow[:, tracker['bodyHull']['triangles']]
+        zLow = np.min(corners, axis=2)
+        zHigh = np.max(corners, axis=2)
+    deep = np.all(zHigh < trough - band, axis=0)
+    inBand = np.any(zLow < crest + band, axis=0) & ~deep
+    tracker['activeHull'] = deepFaceHull(tracker['bodyHull'], np.nonzero(inBand)[0], np.nonzero(deep)[0])
+    tracker['poseZ'] = poses[:, :, 2].copy()
+    tracker['cogZ'] = cog[:, 2].copy()
+    tracker['steps'] = 1
+    tracker['checks'] += 1
+
+def createHullLevels(hull, cellSizes = None):
+    '''
+    CREATEHULLLEVELS Levels of detail of a hull (see loadHull): level 0 is
+    the hull itself, level i > 0 the hull decimated by vertex clustering in
+    cells of size cellSizes[i-1] (see decimateMesh). The cell sizes must
+    increase, by default they are the hull length (x extent of the bounding
+    box) divided by 256, 128, 64, 32 and 16.
+    Output:
+      - levels: list of hull dicts with the same fields as loadHull. Every
+                level keeps the 'cog' and 'bbox' of the full hull, the mass
+                properties of the ship do not depend on its mesh.
+    '''
+    if cellSizes is None:
+        cellSizes = (hull['bbox'][1, 0] - hull['bbox'][0, 0]) / np.array([256, 128, 64, 32, 16])
+    levels = [hull]
+    for vertices in decimateMesh(hull['vertices'][:3 * len(hull['faceAreas'])], cellSizes):
+        facePoints, faceAreas, normals = calculatePointsAreasNormals(vertices)
+        levels.append({
+            # One-based and as doubles, like the faces of stlreadOwn
+            'faces': np.arange(1, len(vertices) + 1, dtype=np.float64).reshape((-1, 3)),
+            'vertices': vertices,
+            'facePoints': facePoints,
+            'faceAreas': faceAreas,
+            'normals': normals,
+            'cog': hull['cog'],
+            'bbox': hull['bbox']
+        })
+    return levels
+
+def hullLevelErrors(levels, ro, g, drafts = None, heels = None, trims = None):
+    '''
+    HULLLEVELERRORS Hydrostatic force and moment error of every level of
+    detail (see createHullLevels) against level 0 in calm water. The force
+    and moment are integrated over the wet part of every triangle (see
+    clippedSums) for all combinations of
+      - drafts: sinkage of the cog below its loaded position [m], by default
+                -0.1 to 0.1 times the hull height in 5 steps;
+      - heels:  roll angles phi [rad], by default -20 to 20 degrees in 5
+                steps;
+      - trims:  pitch angles th [rad], by default -5 to 5 degrees in 3
+                steps.
+    Output:
+      - errors: dict with the number of 'faces' of every level, its
+                'forceError' and 'momentError': the largest error over the
+                poses relative to the largest force (moment) of level 0.
+    '''
+    bbox = levels[0]['bbox']
+    if drafts is None:
+        drafts = 0.1 * (bbox[1, 2] - bbox[0, 2]) * np.linspace(-1, 1, 5)
+    if heels is None:
+        heels = np.deg2rad(np.linspace(-20, 20, 5))
+    if trims is None:
+        trims = np.deg2rad(np.linspace(-5, 5, 3))
+    phi, th = [angle.ravel() for angle in np.meshgrid(heels, trims)]
+    # States of the ship sunk by every draft with every heel and trim
+    states = np.zeros((len(drafts), len(phi), 12))
+    states[:, :, 0:3] = (levels[0]['cog'] - np.outer(drafts, [0, 0, 1]))[:, None, :] * [1, -1, -1]
+    states[:, :, 6] = phi
+    states[:, :, 7] = th
+    poses, cogs = statePoses(states.reshape((-1, 12)))
+    poses = poses.reshape((len(drafts), len(phi), 3, 3))
+    cogs = cogs.reshape((len(drafts), len(phi), 3))
+
+    sums = np.zeros((len(levels), len(drafts), len(phi), 6))
+    for i, level in enumerate(levels):
+        bodyHull = createBodyHull(level, True)
+        for j in range(len(drafts)):
+            facePoints = posedFacePoints(bodyHull, poses[j], cogs[j])
+            F_net, Tau_net = hydrostaticForcesAndTorques(bodyHull, poses[j], facePoints,
+                                                         np.zeros(facePoints.shape[:2]), ro, g)
+            sums[i, j] = np.hstack((F_net, Tau_net))
+    errors = {'faces': np.array([len(level['faceAreas']) for level in levels])}
+    for name, part in (('forceError', slice(0, 3)), ('momentError', slice(3, 6))):
+        difference = np.linalg.norm(sums[..., part] - sums[0, ..., part], axis=3)
+        errors[name] = difference.max(axis=(1, 2)) / np.linalg.norm(sums[0, ..., part], axis=2).max()
+    return errors
+
+def loadHullLevels(shipStruct, hull, ro, g, cacheDir = None):
+    '''
+    LOADHULLLEVELS Levels of detail of the hull of loadHull (see
+    createHullLevels) and their errors (see hullLevelErrors), both with the
+    default settings. They are cached in the hull cache of loadHull (same
+    cacheDir and shipStruct['hullCache']), keyed by the hash of the hull and
+    by ro and g, so only the first run with a hull builds and checks them.
+    Output:
+      - levels, errors: as from createHullLevels and hullLevelErrors.
+    '''
+    if cacheDir is None:
+        cacheDir = shipStruct.get('hullCache', os.path.join(current_dir, 'hull-cache'))
+    cacheFile = None
+    if cacheDir:
+        key = hullCacheKey(shipStruct)
+        key.update(np.array([ro, g], dtype=np.float64).tobytes())
+        cacheFile = os.path.join(cacheDir, f'levels_{key.hexdigest()}.npz')
+        if os.path.isfile(cacheFile):
+            with np.load(cacheFile) as cached:
+                levels = [hull]
+                for i in range(1, len(cached['faces'])):
+                    prefix = f'level{i}_'
+                    levels.append({name[len(prefix):]: cached[name] for name in cached.files
+                                   if name.startswith(prefix)})
+                errors = {name: cached[name] for name in ['faces', 'forceError', 'momentError']}
+            return levels, errors
+
+    levels = createHullLevels(hull)
+    errors = hullLevelErrors(levels, ro, g)
+    if cacheFile is not None:
+        os.makedirs(cacheDir, exist_ok=True)
+        arrays = dict(errors)
+        for i, level in enumerate(levels[1:], 1):
+            arrays.update({f'level{i}_{name}': value for name, value in level.items()})
+        # Write to a temporary file first so parallel runs never read a half-written cache
+        tmpFile = f'{cacheFile}.{os.getpid()}.tmp.npz'
+        np.savez(tmpFile, **arrays)
+        os.replace(tmpFile, cacheFile)
+    return levels, errors
+
+def selectHullLevel(errors, errorBudget):
+    # Index of the coarsest level of detail whose force and moment errors
+    # (see hullLevelErrors) are both within errorBudget; level 0 always is
+    within = np.nonzero(np.maximum(errors['forceError'], errors['momentError']) <= errorBudget)[0]
+    return int(within[-1]) if len(within) else 0
 
 def getVelMetPerTs(vel, Ts):
     # Gets a velocity in m/s and returns a velocity in m/Ts
     velMeterPerTs = vel * Ts
     return velMeterPerTs
-def simulateShip(wavesFile, shipStruct, isPlot, isVisual,demonum):
+
+def createShipModel(shipStruct, Ts):
+    # Returns the dict model with the ship's constants (see simulateShip),
+    # the regulator gains and references, and the update matrices A and B
+    # discretized with the sample time Ts (Ad, Bd). Shared by all members of
+    # an ensemble.
+    # ----- Non-tunable constants
+
+    # Ship dimensions inheritant to HMS Norfolk
+    length = shipStruct['len']
+    width = shipStruct['width']
+    height = shipStruct['height']
+    M = shipStruct['M']
+    # Cross sectional area of the submerged hull
+    Au = width * 0.9 * height * 0.33
+    Av = height * 0.33 * length
+    Aw = length * width * 0.9
+
+    #Ship's moment of inertia
+    I = M / 12 * np.diag([width**2 + height**2, length**2 + height**2, length**2 + width**2])
+    Iu = I[0, 0]
+    Iv = I[1, 1]
+    Iw = I[2, 2]
+
+    # Physical constants
+    ro = 997
+    g = 9.81
+
+    # ----- Tunable constants
+    Kp_force = 9.5
+    Ki_force = 0.82
+    Kp_torque = 3.5
+    Ki_torque = 0.5
+
+    C_du = 2.5
+    C_dv = 2.5
+    C_dw = 2.5
+
+    B_phi = 1e10 / 20
+    B_th  = 1e10 
+    B_psi = 1e10
+
+    # ----- Define update matrices A and B (C is arbitrary) and discretize.
+    #x y z      v_u       v_v     v_w         phi th psi w_phi   w_th w_psi
+    A = np.array([[0,0,0, 1, 0, 0, 0, 0, 0, 0, 0, 0],
+                  [0,0,0, 0, 1, 0, 0, 0, 0, 0, 0, 0],
+                  [0,0,0, 0, 0, 1, 0, 0, 0, 0, 0, 0],
+                  [0,0,0, -C_du*ro*Au/M, 0, 0, 0, 0, 0, 0, 0, 0],
+                  [0,0,0, 0, -C_dv*ro*Av/M, 0, 0, 0, 0, 0, 0, 0],
+                  [0,0,0, 0, 0, -C_dw*ro*Aw/M, 0, 0, 0, 0, 0, 0],
+                  [0,0,0, 0, 0, 0, 0, 0, 0, 1, 0, 0],
+                  [0,0,0, 0, 0, 0, 0, 0, 0, 0, 1, 0],
+                  [0,0,0, 0, 0, 0, 0, 0, 0, 0, 0, 1],
+                  [0,0,0, 0, 0, 0, 0, 0, 0, -B_phi/Iu, 0, 0],
+                  [0,0,0, 0, 0, 0, 0, 0, 0, 0, -B_th/Iv, 0],
+                  [0,0,0, 0, 0, 0, 0, 0, 0, 0, 0, -B_psi/Iw]])
+    # F_x/M   F_y/M   F_z/M   Tau_x/Ix   Tau_y/Iy   Tau_z/Iz
+    B = np.array([[0, 0, 0, 0, 0, 0],
+                  [0, 0, 0, 0, 0, 0],
+                  [0, 0, 0, 0, 0, 0],
+                  [1, 0, 0, 0, 0, 0],
+                  [0, 1, 0, 0, 0, 0],
+                  [0, 0, 1, 0, 0, 0],
+                  [0, 0, 0, 0, 0, 0],
+                  [0, 0, 0, 0, 0, 0],
+                  [0, 0, 0, 0, 0, 0],
+                  [0, 0, 0, 1, 0, 0],
+                  [0, 0, 0, 0, 1, 0],
+                  [0, 0, 0, 0, 0, 1]])
+
+    C = np.array([[1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+              [0, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+              [0, 0, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0]])
+
+    sys_ = c2d((A, B, C, []), Ts)
+    Ad, Bd, _, _, _ = sys_
+
+    model = {
+        'M': M, 'Iu': Iu, 'Iv': Iv, 'Iw': Iw, 'ro': ro, 'g': g,
+        'Kp_force': Kp_force, 'Ki_force': Ki_force,
+        'Kp_torque': Kp_torque, 'Ki_torque': Ki_torque,
+        'Ad': Ad, 'Bd': Bd, 'Ts': Ts,
+        # ----- Define reference states
+        'refSpeedU': getVelMetPerTs(shipStruct['refSpeedU'], Ts),  # m/Ts
+        'refYaw': shipStruct['refYaw']
+    }
+    return model
+
+def createStepKernel(model, states):
+    '''
+    CREATESTEPKERNEL Time update of a batch of N ships that works in place
+    on preallocated buffers, so a step creates no new arrays.
+    Inputs:
+      - model:  see createShipModel;
+      - states: initial states (N, 12).
+    Ouput:
+      - kernel: dict with the current 'states' (N, 12), the states of the
+                previous step 'previous', the integral parts 'extraUForce'
+                and 'extraYawTorque' (N,) of the PI-regulators and
+                the pose of the hulls in the current states, 'rotation' =
+                R(phi, -th, -psi) (N, 3, 3) and 'cog' (N, 3), as returned by
+                statePoses. Advance it with stepStates.
+    The sines and cosines of the angles are computed once per step and give
+    'rotation', R(phi, th, psi) (as in R) and the transformation T(phi, th)
+    of the angular velocities to the Euler angle rates (Gustafsson,
+    "Statistical Sensor Fusion" 3rd edition, Eq. (13.9), p. 349).
+    '''
+    n = states.shape[0]
+    Ad = model['Ad']
+    kernel = {
+        'states': np.array(states, dtype=np.float64),
+        'previous': np.array(states, dtype=np.float64),
+        'extraUForce': np.zeros(n),
+        'extraYawTorque': np.zeros(n),
+        # Diagonal of Ad and the couplings of the position and angle rows
+        'decay': np.diag(Ad).copy(),
+        'velocityGain': np.array([Ad[0, 3], Ad[1, 4], Ad[2, 5]]),
+        'rotVelGain': np.array([Ad[6, 9], Ad[7, 10], Ad[8, 11]]),
+        'BdT': np.ascontiguousarray(model['Bd'].T, dtype=np.float64),
+        # Forces and torques to accelerations with the signs of the states
+        'forceScale': np.array([model['M'], -model['M'], -model['M']]),
+        'torqueScale': np.array([model['Iu'], -model['Iv'], -model['Iw']]),
+        # Axis flip S = diag(1, -1, -1), R(phi, th, psi) = S R(phi, -th, -psi) S
+        'flip': np.array([1.0, -1.0, -1.0]),
+        'nextAxis': np.array([1, 2, 0]),
+        'previousAxis': np.array([2, 0, 1]),
+        'cos': np.empty((n, 3)),
+        'sin': np.empty((n, 3)),
+        'scratch': np.empty((n, 3)),
+        'column': np.empty((n, 3, 1)),
+        'rotX': np.zeros((n, 3, 3)),
+        'rotY': np.zeros((n, 3, 3)),
+        'rotZ': np.zeros((n, 3, 3)),
+        'rotYZ': np.empty((n, 3, 3)),
+        'rotation': np.empty((n, 3, 3)),
+        'cog': np.empty((n, 3)),
+        'T': np.zeros((n, 3, 3)),
+        'inputs': np.empty((n, 6)),
+        'velocity': np.empty((n, 3, 1)),
+        'rotVelDerivative': np.empty((n, 3, 1)),
+        'coriolis': np.empty((n, 3)),
+        'update': np.empty((n, 12))
+    }
+    kernel['rotX'][:, 0, 0] = 1
+    kernel['rotY'][:, 1, 1] = 1
+    kernel['rotZ'][:, 2, 2] = 1
+    kernel['T'][:, 0, 0] = 1
+    updatePose(kernel)
+    return kernel
+
+def updatePose(kernel):
+    # Fills the pose 'rotation' = R(phi, -th, -psi) = Rx(phi) Ry(-th) Rz(-psi)
+    # and 'cog', and T(phi, th) of the current states from one evaluation of
+    # the sines and cosines
+    c = kernel['cos']
+    s = kernel['sin']
+    np.cos(kernel['states'][:, 6:9], out=c)
+    np.sin(kernel['states'][:, 6:9], out=s)
+    rotX, rotY, rotZ = kernel['rotX'], kernel['rotY'], kernel['rotZ']
+    rotX[:, 1, 1] = c[:, 0]
+    rotX[:, 1, 2] = s[:, 0]
+    np.negative(s[:, 0], out=rotX[:, 2, 1])
+    rotX[:, 2, 2] = c[:, 0]
+    rotY[:, 0, 0] = c[:, 1]
+    rotY[:, 0, 2] = s[:, 1]
+    np.negative(s[:, 1], out=rotY[:, 2, 0])
+    rotY[:, 2, 2] = c[:, 1]
+    rotZ[:, 0, 0] = c[:, 2]
+    np.negative(s[:, 2], out=rotZ[:, 0, 1])
+    rotZ[:, 1, 0] = s[:, 2]
+    rotZ[:, 1, 1] = c[:, 2]
+    np.matmul(rotY, rotZ, out=kernel['rotYZ'])
+    np.matmul(rotX, kernel['rotYZ'], out=kernel['rotation'])
+    np.multiply(kernel['states'][:, 0:3], kernel['flip'], out=kernel['cog'])
+
+    T = kernel['T']
+    tanTh = kernel['scratch'][:, 0]
+    secTh = kernel['scratch'][:, 1]
+    np.divide(s[:, 1], c[:, 1], out=tanTh)
+    np.reciprocal(c[:, 1], out=secTh)
+    np.multiply(s[:, 0], tanTh, out=T[:, 0, 1])
+    np.multiply(c[:, 0], tanTh, out=T[:, 0, 2])
+    T[:, 1, 1] = c[:, 0]
+    np.negative(s[:, 0], out=T[:, 1, 2])
+    np.multiply(s[:, 0], secTh, out=T[:, 2, 1])
+    np.multiply(c[:, 0], secTh, out=T[:, 2, 2])
+
+def stepStates(kernel, F_net, Tau_net, model):
+    # Time update of the kernel's states with F_net and Tau_net (N, 3) from
+    # hydrostaticForcesAndTorques. The states of the step are kept in
+    # 'previous' and the pose is updated for the new states.
+    previous = kernel['previous']
+    states = kernel['states']
+    np.copyto(previous, states)
+    vel = previous[:, 3:6]
+    rotVel = previous[:, 9:12]
+
+    # ------- Set up input
+    # PI-regulators, Ki * integral part + Kp * (ref - current)
+    regulation = kernel['scratch'][:, 0]
+    extraUForce = kernel['extraUForce']
+    extraUForce *= model['Ki_force']
+    np.subtract(model['refSpeedU'], previous[:, 3], out=regulation)
+    regulation *= model['Kp_force']
+    extraUForce += regulation
+    extraYawTorque = kernel['extraYawTorque']
+    extraYawTorque *= model['Ki_torque']
+    np.subtract(model['refYaw'], previous[:, 8], out=regulation)
+    regulation *= model['Kp_torque']
+    extraYawTorque += regulation
+
+    inputs = kernel['inputs']
+    column = kernel['column']
+    np.divide(F_net, kernel['forceScale'], out=column[:, :, 0])
+    column[:, 2, 0] += model['g']
+    np.matmul(kernel['rotation'], column, out=inputs[:, 0:3, None])
+    inputs[:, 0] += extraUForce
+    np.divide(Tau_net, kernel['torqueScale'], out=inputs[:, 3:6])
+    inputs[:, 5] += extraYawTorque
+
+    # ------- Time-update
+    # Velocity in global coordinates R(phi, th, psi).T @ vel, with
+    # R(phi, th, psi) = S rotation S
+    velocity = kernel['velocity']
+    np.multiply(vel, kernel['flip'], out=column[:, :, 0])
+    np.matmul(kernel['rotation'].transpose(0, 2, 1), column, out=velocity)
+    velocity[:, :, 0] *= kernel['flip']
+    np.matmul(kernel['T'], rotVel[:, :, None], out=kernel['rotVelDerivative'])
+    # Coriolis term rotVel x vel
+    coriolis = kernel['coriolis']
+    scratch = kernel['scratch']
+    np.take(rotVel, kernel['nextAxis'], axis=1, out=coriolis)
+    np.take(vel, kernel['previousAxis'], axis=1, out=scratch)
+    coriolis *= scratch
+    np.take(rotVel, kernel['previousAxis'], axis=1, out=scratch)
+    np.take(vel, kernel['nextAxis'], axis=1, out=column[:, :, 0])
+    scratch *= column[:, :, 0]
+    coriolis -= scratch
+
+    # Make time-update as below due to non-linearities in the A matrix
+    np.multiply(previous, kernel['decay'], out=states)
+    velocity[:, :, 0] *= kernel['velocityGain']
+    states[:, 0:3] += velocity[:, :, 0]
+    coriolis *= model['Ts']
+    states[:, 3:6] -= coriolis
+    kernel['rotVelDerivative'][:, :, 0] *= kernel['rotVelGain']
+    states[:, 6:9] += kernel['rotVelDerivative'][:, :, 0]
+    np.matmul(inputs, kernel['BdT'], out=kernel['update'])
+    states += kernel['update']
+    updatePose(kernel)
+
+def statePoses(states):
+    # Poses (N, 3, 3) and centers of gravity cog (N, 3) of the hulls of N
+    # ships with states (N, 12), for posedFacePoints: the body-frame points
+    # are rotated by R(phi, -th, -psi).T and moved to cog = [x, -y, -z].
+    # The pose only depends on the current states, so the hull can be
+    # evaluated at any state without replaying the steps before it.
+    poses = np.moveaxis(R(states[:, 6], -states[:, 7], -states[:, 8]), -1, 0)
+    cog = states[:, 0:3] * [1, -1, -1]
+    return poses, cog
+
+def simulateShip(wavesFile, shipStruct, isPlot, isVisual,demonum, prefetch = 0, windowMargin = 0, simTs = None,
+                 interpolate = False, waterlineRecheck = 0, clipWaterline = False, hullErrorBudget = None):
   '''
   SIMULATESHIP Ship on sea simulation. Given a waves file and a ship,
   simulates 12 states of the ship through time. The states are: 
@@ -81,11 +837,54 @@ def simulateShip(wavesFile, shipStruct, isPlot, isVisual,demonum):
   added mass, wind forces, dynamic water forces, etc. To calculate the 
   inertia, the ship was assumed to be a solid cuboid. 
   Inputs:
-    - wavesFile:  file containing waves and its properties;
+    - wavesFile:  file containing waves and its properties, or a dict with
+                  the same fields (e.g. attached to shared memory with
+                  sharedWaves.attachWaves in a worker process). For a procedural sea pass a dict with
+                  'components' (from simulateWaves.createWaveComponents),
+                  'tVec', 'Ts' and 'beta' instead of the 'waves' grid: the
+                  wave height is then evaluated at the hull faces each step
+                  and no grid is generated or stored. A dict with 'xiVec',
+                  'wavesXi' and 'direction' (from createProjectedWaves) is a
+                  long-crested sea stored on its 1-D projected axis;
     - shipStruct: struct containing STL file and other ship properties;
+                  the preprocessed hull is cached on disk (see loadHull);
     - isPlot:     boolean, if true: plots states through time;
     - isVisual:   boolean, if true: show visualization of simulation in 3D.
     - demonum:    number of the demo to be run. # Added by me to reproduce visualiztion without simulation
+    - prefetch:   optional number of time steps per slab. If > 0, a
+                  background thread loads the waves grid (or synthesises it
+                  from spectral 'components' with 'xVec' and 'yVec') slab
+                  by slab while the ship is stepped (see
+                  createWavePrefetcher).
+    - windowMargin: optional, for a procedural sea ('components'). If > 0,
+                  the waves are generated on a 1 m grid only in a box around
+                  the hull, with this margin in cells, which follows the
+                  ship (see createSeaWindow).
+    - simTs:      optional time step of the simulation, by default the Ts of
+                  the waves. A grid or projected sea with another Ts is
+                  interpolated in time (see interpolate);
+    - interpolate: optional, sample a grid or projected sea bilinearly in x
+                  and y and linearly in t instead of at the nearest grid
+                  cell and time index, for grids of any spacing. Always on
+                  for a grid other than xVec = yVec = 0, 1, 2, ... (see
+                  isUnitGrid);
+    - waterlineRecheck: optional. If > 0, only the faces in a band below
+                  the wave crests are evaluated each step and all faces
+                  are re-checked every waterlineRecheck steps (see
+                  createWetFaceTracker);
+    - clipWaterline: optional, sample the waves at the vertices and
+                  integrate the pressure exactly over the wet part of every
+                  triangle (see clippedSums) instead of counting a face as
+                  wet when the wave is above its center. Coarse hull meshes
+                  then give smooth and accurate forces.
+    - hullErrorBudget: optional relative error, e.g. 0.01. The forces are
+                  then integrated over the coarsest level of detail of the
+                  hull (see createHullLevels) whose calm-water force and
+                  moment errors over a range of drafts, heel and trim
+                  angles (see hullLevelErrors) are within the budget, with
+                  clipWaterline. The levels and their errors are cached
+                  with the hull (see loadHullLevels). The full hull is
+                  still returned for the visualization.
   Outputs:
     - states:    all 12 states simulated through the time vector defined in
                   the wave file;
@@ -116,109 +915,64 @@ def simulateShip(wavesFile, shipStruct, isPlot, isVisual,demonum):
   print("\nStarted shipOnSea simulation!\n")
 
   # ------------------------------- Define constants ------------------------
-  # ----- Non-tunable constants
-
   # Ship dimensions inheritant to HMS Norfolk
   length = shipStruct['len']
-  width = shipStruct['width']
-  height = shipStruct['height']
-  M = shipStruct['M']
-  # Cross sectional area of the submerged hull
-  Au = width * 0.9 * height * 0.33
-  Av = height * 0.33 * length
-  Aw = length * width * 0.9
-
-  # Offset to ship's center of gravity, set by trial and error
-  cogOffset = shipStruct['cogOffset']
-
-  #Ship's moment of inertia
-  I = M / 12 * np.diag([width**2 + height**2, length**2 + height**2, length**2 + width**2])
-  Iu = I[0, 0]
-  Iv = I[1, 1]
-  Iw = I[2, 2]
-
-  # Physical constants
-  ro = 997
-  g = 9.81
-
-  # ----- Tunable constants
-  Kp_force = 9.5
-  Ki_force = 0.82
-  Kp_torque = 3.5
-  Ki_torque = 0.5
-
-  C_du = 2.5
-  C_dv = 2.5
-  C_dw = 2.5
-
-  B_phi = 1e10 / 20
-  B_th  = 1e10 
-  B_psi = 1e10
-
   # Load waves
   print('1) Loading waves...')
-  wavesData = sio.loadmat(wavesFile)
-  waves = wavesData['wavesStruct']['waves'][0, 0]
-  beta = wavesData['wavesStruct']['beta'][0, 0]
-  xVec = wavesData['wavesStruct']['xVec'][0, 0][0]
-  yVec = wavesData['wavesStruct']['yVec'][0, 0][0]
-  tVec = wavesData['wavesStruct']['tVec'][0, 0][0]
-  Ts = wavesData['wavesStruct']['Ts'][0, 0][0]
-  displayName = wavesData['wavesStruct']['displayName'][0, 0][0]
+  if isinstance(wavesFile, dict):
+    wavesStruct = wavesFile
+  else:
+    wavesStruct = loadWavesFile(wavesFile)
+  waves = wavesStruct.get('waves')
+  beta = wavesStruct['beta']
+  tVec = wavesStruct['tVec']
+  Ts = wavesStruct['Ts']
+  displayName = wavesStruct.get('displayName', 'Procedural sea')
   print('Waves loaded:\n', displayName)
+  if simTs is not None and simTs != Ts:
+    # The simulation runs with its own time step within the waves' time span
+    wavesTVec = np.ravel(tVec)
+    Ts = simTs
+    tVec = wavesTVec[0] + Ts * np.arange(int(np.floor((wavesTVec[-1] - wavesTVec[0]) / Ts + 1e-9)) + 1)
+    interpolate = True
+  if 'components' in wavesStruct:
+    # Procedural seas are evaluated at the simulation times directly
+    wavesStruct = dict(wavesStruct, tVec=tVec, Ts=Ts)
+    interpolate = False
+  if 'waves' in wavesStruct and not isUnitGrid(wavesStruct):
+    # Other grids are sampled at their coordinates
+    if prefetch > 0:
+      raise ValueError('Prefetched waves are read by nearest cell and need a 1 m grid xVec = yVec = 0, 1, 2, ...')
+    interpolate = True
+  if interpolate and prefetch > 0:
+    raise ValueError('Prefetched waves are read by time index and can not be interpolated.')
 
   # Load ship's STL file
   print('2) Loading ship and computing normal vectors to triangles...')
-  faces, vertices, _ = stlreadOwn(shipStruct['file'])
-  vertices += shipStruct['verticesPos']
-  cog = np.array([(np.max(vertices[:, 0]) + np.min(vertices[:, 0])) / 2,
-                  (np.max(vertices[:, 1]) + np.min(vertices[:, 1])) / 2,
-                  (np.max(vertices[:, 2]) + np.min(vertices[:, 2])) / 2],dtype=np.float32)
-  cog = cog + cogOffset
-  facePoints, faceAreas, normals = calculatePointsAreasNormals(vertices)
+  hull = loadHull(shipStruct)
+  faces = hull['faces']
+  vertices = hull['vertices']
+  cog = hull['cog']
   print('Boat loaded!')
 
   # Define time update model and simulate
   print('3) Simulating states through time...')
-  # ----- Define update matrices A and B (C is arbitrary) and discretize.
-  #x y z      v_u       v_v     v_w         phi th psi w_phi   w_th w_psi
-  A = np.array([[0,0,0, 1, 0, 0, 0, 0, 0, 0, 0, 0],
-                [0,0,0, 0, 1, 0, 0, 0, 0, 0, 0, 0],
-                [0,0,0, 0, 0, 1, 0, 0, 0, 0, 0, 0],
-                [0,0,0, -C_du*ro*Au/M, 0, 0, 0, 0, 0, 0, 0, 0],
-                [0,0,0, 0, -C_dv*ro*Av/M, 0, 0, 0, 0, 0, 0, 0],
-                [0,0,0, 0, 0, -C_dw*ro*Aw/M, 0, 0, 0, 0, 0, 0],
-                [0,0,0, 0, 0, 0, 0, 0, 0, 1, 0, 0],
-                [0,0,0, 0, 0, 0, 0, 0, 0, 0, 1, 0],
-                [0,0,0, 0, 0, 0, 0, 0, 0, 0, 0, 1],
-                [0,0,0, 0, 0, 0, 0, 0, 0, -B_phi/Iu, 0, 0],
-                [0,0,0, 0, 0, 0, 0, 0, 0, 0, -B_th/Iv, 0],
-                [0,0,0, 0, 0, 0, 0, 0, 0, 0, 0, -B_psi/Iw]])
-  # F_x/M   F_y/M   F_z/M   Tau_x/Ix   Tau_y/Iy   Tau_z/Iz
-  B = np.array([[0, 0, 0, 0, 0, 0],
-                [0, 0, 0, 0, 0, 0],
-                [0, 0, 0, 0, 0, 0],
-                [1, 0, 0, 0, 0, 0],
-                [0, 1, 0, 0, 0, 0],
-                [0, 0, 1, 0, 0, 0],
-                [0, 0, 0, 0, 0, 0],
-                [0, 0, 0, 0, 0, 0],
-                [0, 0, 0, 0, 0, 0],
-                [0, 0, 0, 1, 0, 0],
-                [0, 0, 0, 0, 1, 0],
-                [0, 0, 0, 0, 0, 1]])
-
-  C = np.array([[1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
-            [0, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
-            [0, 0, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0]])
-
-  sys_ = c2d((A, B, C, []), Ts)
-  Ad, Bd, _, _, _ = sys_
-  # ----- Define reference states and initialize other variables
-  refSpeedU = getVelMetPerTs(shipStruct['refSpeedU'], Ts)  # m/Ts
-  refYaw = shipStruct['refYaw']
-  extraUForce = 0
-  extraYawTorque = 0
+  model = createShipModel(shipStruct, Ts)
+  ro = model['ro']
+  g = model['g']
+
+  # ----- Forces on the coarsest level of detail of the hull within the budget
+  forceHull = hull
+  if hullErrorBudget is not None:
+    levels, errors = loadHullLevels(shipStruct, hull, ro, g)
+    level = selectHullLevel(errors, hullErrorBudget)
+    for i in range(len(levels)):
+      print(f'Hull level {i}: {errors["faces"][i]} faces, force error {100 * errors["forceError"][i]:.2f}%, '
+            f'moment error {100 * errors["momentError"][i]:.2f}%')
+    print(f'Using hull level {level} for the forces')
+    forceHull = levels[level]
+    clipWaterline = True
+
   cogVec = np.zeros((len(tVec), 3))
 
   # ----- Initialize all states and set 1st state
@@ -226,103 +980,45 @@ def simulateShip(wavesFile, shipStruct, isPlot, isVisual,demonum):
   #  [x       y       z     ], [v_u v_v v_w phi th psi w_phi w_th w_psi]'
   states[:, 0] = np.concatenate(([cog[0], -cog[1], -cog[2]], shipStruct['x0']))
 
-  # ----- Rotate facePoints & normals according to initial states
-  phi = states[6, 0]
-  th  = states[7, 0]
-  psi = states[8, 0]
-  rotation_matrix = R(phi, -th, -psi)  # Assuming R is a function for calculating the rotation matrix
-  facePoints = np.dot(rotation_matrix.T, (facePoints - cog).T).T + cog
-  normals = np.dot(rotation_matrix.T, normals.T).T
+  # ----- The hull is posed from the current states every step
+  # The step functions work on batches, this is a batch of one ship
+  bodyHull = createBodyHull(forceHull, clipWaterline)
+  kernel = createStepKernel(model, states[:, 0][None])
+  tracker = createWetFaceTracker(bodyHull, waterlineRecheck) if waterlineRecheck > 0 else None
+
+  # ----- A procedural sea is marched in time alongside the ship
+  waveStepper = None
+  prefetcher = None
+  seaWindow = None
+  if prefetch > 0:
+    prefetcher = createWavePrefetcher(wavesStruct, prefetch)
+  elif windowMargin > 0 and 'components' in wavesStruct:
+    seaWindow = createSeaWindow(wavesStruct['components'], tVec, windowMargin)
+  elif 'components' in wavesStruct:
+    waveStepper = createWaveStepper(wavesStruct['components'], tVec[0], Ts)
   # ----- State update for all time steps
-  for tIdx in range(len(tVec)-1):
-    cogVec[tIdx, :] = cog
-    # ------- Compute sum of all forces F_net & sum of all torques Tau_net
-    F_net = np.zeros((3, ))
-    Tau_net = np.zeros((3, ))
-
-    for nIdx in range(len(normals)):
-      # Get index of waves that is closest to the evaluated normal
-      xIdx = int(round(facePoints[nIdx, 0])) - 1
-      yIdx = int(round(facePoints[nIdx, 1])) - 1
-      facePointHeight = facePoints[nIdx, 2]
-
-      # Extract wave height at the given indices
-      waveHeight = waves[yIdx, xIdx, tIdx]
-
-      # Add netto component if wave is above the considered normal
-      if waveHeight > facePointHeight:
-        # Force
-        h = waveHeight - facePointHeight
-        volume = h * faceAreas[nIdx]
-        F_buoy = ro * g * volume * normals[nIdx, :]
-        F_net += F_buoy
-
-        # Torque
-        lever = (facePoints[nIdx, :] - cog).reshape((3, 1))
-        phi, th, psi = states[6:9, tIdx]
-        R_phi_th_psi = R(phi, -th, -psi)
-        lever_rotated = R_phi_th_psi @ lever
-        F_buoy_rotated = R_phi_th_psi @ F_buoy
-        Tau = np.cross(lever_rotated.flatten(), F_buoy_rotated.flatten())
-        Tau_net += Tau
+  # The prefetcher thread is stopped also when a step fails
+  try:
+    for tIdx in range(len(tVec)-1):
+      cogVec[tIdx, :] = kernel['cog'][0]
+      # ------- Compute sum of all forces F_net & sum of all torques Tau_net
+      stepHull = bodyHull if tracker is None else wetFaceHull(tracker, kernel['rotation'], kernel['cog'])
+      facePoints = posedFacePoints(stepHull, kernel['rotation'], kernel['cog'])
+      waveHeights = sampleWaves(wavesStruct, facePoints[0], tIdx, waveStepper, prefetcher, seaWindow,
+                                tVec[tIdx] if interpolate else None)
+      if waveStepper is not None:
+        advanceWaveStepper(waveStepper)
+      if tracker is not None and stepHull is bodyHull:
+        updateWetFaces(tracker, kernel['rotation'], kernel['cog'], facePoints, waveHeights[None])
+      F_net, Tau_net = hydrostaticForcesAndTorques(stepHull, kernel['rotation'], facePoints, waveHeights[None],
+                                                   ro, g)
 
-    # ------- Set up input
-    phi = states[6, tIdx]
-    th = states[7, tIdx]
-    psi = states[8, tIdx]
-    v_u = states[3, tIdx]
-    
-    extraUForce = Ki_force * extraUForce + pRegulator(Kp_force, refSpeedU, v_u)
-    
-    forcesInLocalCoord = R(phi,-th,-psi) @ np.array([F_net[0]/M, -F_net[1]/M, -F_net[2]/M + g],dtype = np.float32).flatten() + np.array([[extraUForce], [0], [0]],dtype = np.float32).flatten()
-    
-    extraYawTorque = Ki_torque * extraYawTorque + pRegulator(Kp_torque, refYaw, psi)
-    torqueInLocalCoord = np.array([Tau_net[0]/Iu, -Tau_net[1]/Iv, -Tau_net[2]/Iw],dtype = np.float32) + np.array([0, 0, extraYawTorque],dtype = np.float32)
-    
-    inputs = np.concatenate((forcesInLocalCoord, torqueInLocalCoord), axis=0)
-    
-    # ------- Time-update
-    v_u = states[3, tIdx]
-    v_v = states[4, tIdx]
-    v_w = states[5, tIdx]
-    w_phi = states[9, tIdx]
-    w_th = states[10, tIdx]
-    w_psi = states[11, tIdx]
-    
-    velInGlobalCoord = np.linalg.inv(R(phi, th, psi)) @ np.array([[v_u], [v_v], [v_w]])
-    rotVelDerivative = T(phi, th) @ np.array([[w_phi], [w_th], [w_psi]])
-
-    coriolisV = np.cross(np.array([[w_phi, w_th, w_psi]]), np.array([[v_u, v_v, v_w]]))
-
-    
-    # Make time-update as below due to non-linearities in the A matrix
-    op1 = np.array([[states[0,tIdx] + Ad[0, 3] * velInGlobalCoord[0, 0]],
-                    [states[1,tIdx] + Ad[1, 4] * velInGlobalCoord[1, 0]],
-                    [states[2,tIdx] + Ad[2, 5] * velInGlobalCoord[2, 0]],
-                    [states[3, tIdx]* Ad[3, 3] - Ts * coriolisV[0, 0]],
-                    [states[4, tIdx]* Ad[4, 4] - Ts * coriolisV[0, 1]],
-                    [states[5, tIdx]* Ad[5, 5] - Ts * coriolisV[0, 2]],
-                    [states[6,tIdx] + Ad[6, 9] *rotVelDerivative[0, 0]],
-                    [states[7,tIdx] + Ad[7, 10]*rotVelDerivative[1, 0]],
-                    [states[8,tIdx] + Ad[8, 11]*rotVelDerivative[2, 0]],
-                    [Ad[9, 9] * states[9, tIdx]],
-                    [Ad[10, 10] * states[10, tIdx]],
-                    [Ad[11, 11] * states[11, tIdx]]],dtype = np.float32).flatten()
-    op2 = (Bd @ inputs).flatten()
-    states[:, tIdx+1] = op1 + op2
-
-    # ------- Update ship hull
-    deltaX = states[0, tIdx+1] - states[0, tIdx]
-    deltaY = states[1, tIdx+1] - states[1, tIdx]
-    deltaZ = states[2, tIdx+1] - states[2, tIdx]
-    
-    deltaPhi = states[6, tIdx+1] - states[6, tIdx]
-    deltaTh  = states[7, tIdx+1] - states[7, tIdx]
-    deltaPsi = states[8, tIdx+1] - states[8, tIdx]
-    
-    facePoints = (R(deltaPhi, -deltaTh, -deltaPsi).T @ (facePoints - cog).T).T + cog + np.array([[deltaX, -deltaY, -deltaZ]])
-    normals = (R(deltaPhi, -deltaTh, -deltaPsi).T @ normals.T).T
-    cog = cog + np.array([[deltaX, -deltaY, -deltaZ]])  
+      # ------- Time-update, the hull follows with the new pose
+      stepStates(kernel, F_net, Tau_net, model)
+      states[:, tIdx+1] = kernel['states'][0]
+  finally:
+    if prefetcher is not None:
+      closePrefetcher(prefetcher)
   print('Simulation done!')
 
   
@@ -340,14 +1036,35 @@ def simulateShip(wavesFile, shipStruct, isPlot, isVisual,demonum):
   # Save variables to a .mat file
   visualizeStruct = {
       'states': states,
-      'waves': waves,
-      'xVec': xVec,
-      'yVec': yVec,
       'tVec': tVec,
       'faces': faces,
       'vertices': vertices,
       'cogVec': cogVec
   }
+  if interpolate:
+    # The frames of the waves have their own time vector
+    visualizeStruct['wavesTVec'] = wavesStruct['tVec']
+  if waves is None:
+    # Procedural or projected sea, store what the frames are rebuilt from
+    # and a grid covering the track
+    track = cogVec[:-1, :]
+    trackMin = np.floor(np.min(track, axis=0) - length)
+    trackMax = np.ceil(np.max(track, axis=0) + length)
+    visualizeStruct['xVec'] = wavesStruct.get('xVec', np.arange(trackMin[0], trackMax[0]))
+    visualizeStruct['yVec'] = wavesStruct.get('yVec', np.arange(trackMin[1], trackMax[1]))
+    if 'wavesXi' in wavesStruct:
+      for key in ['xiVec', 'wavesXi', 'direction']:
+        visualizeStruct[key] = wavesStruct[key]
+    else:
+      visualizeStruct['components'] = wavesStruct['components']
+  else:
+    visualizeStruct['xVec'] = wavesStruct['xVec']
+    visualizeStruct['yVec'] = wavesStruct['yVec']
+    if isinstance(waves, np.memmap):
+      # Streamed waves stay on disk, only store where to find them
+      visualizeStruct['wavesFile'] = waves.filename
+    else:
+      visualizeStruct['waves'] = waves
   sio.savemat(f'{current_dir}/simulation-results/Simulation_{demonum}_Result_visualizeStruct.mat', visualizeStruct)
 
   return states, faces, vertices, cogVec
@@ -0,0 +1,103 @@
+import numpy as np
+import os
+import sys
+
+# Append the relative path to the help-files folder
+current_dir = os.path.dirname(os.path.abspath(__file__))
+help_files_path = os.path.join(current_dir, 'help-files')
+sys.path.append(help_files_path)
+from loadWavesFile import loadWavesFile
+from waveElevation import createWaveStepper, advanceWaveStepper
+from simulateShip import loadHull, createBodyHull, posedFacePoints, sampleWaves, hydrostaticForcesAndTorques, createShipModel, createStepKernel, stepStates
+
+def simulateShipEnsemble(wavesFiles, shipStruct, x0s = None, hull = None):
+    '''
+    SIMULATESHIPENSEMBLE Simulates an ensemble of N ships (same hull and
+    model) through time in one batched state array, e.g. N realizations of
+    the same sea state or N initial conditions. Every time step the forces
+    of all members are computed by one call to hydrostaticForcesAndTorques
+    and the states are updated together, so the per-step Python overhead is
+    paid once for the whole ensemble instead of once per ship. The members
+    share the body-frame hull (see createBodyHull) and only carry their own
+    pose and cog, so the force sums are matrix products over all members.
+    Inputs:
+      - wavesFiles: list of N waves files or dicts (see simulateShip), one
+                    sea per member, or a single file/dict shared by all
+                    members. All seas must have the same tVec and Ts;
+      - shipStruct: struct containing STL file and other ship properties,
+                    as in simulateShip;
+      - x0s:        initial states [v_u v_v v_w phi th psi w_phi w_th w_psi]
+                    of size (N, 9). Defaults to shipStruct['x0'] for every
+                    member;
+      - hull:       optional hull already loaded by loadHull(shipStruct), so
+                    repeated calls do not load it again.
+    Outputs:
+      - states:   array of size (N, 12, length(tVec)), states(i, :, :) is the
+                  states array simulateShip returns for member i;
+      - faces:    ship's faces;
+      - vertices: ship's vertices;
+      - cogVec:   center of gravity of every member, (N, length(tVec), 3).
+    '''
+    # Load waves
+    if isinstance(wavesFiles, (list, tuple)):
+        wavesStructs = [wavesFile if isinstance(wavesFile, dict) else loadWavesFile(wavesFile) for wavesFile in wavesFiles]
+        isShared = False
+    else:
+        wavesStructs = [wavesFiles if isinstance(wavesFiles, dict) else loadWavesFile(wavesFiles)]
+        isShared = True
+    tVec = wavesStructs[0]['tVec']
+    Ts = wavesStructs[0]['Ts']
+    for wavesStruct in wavesStructs[1:]:
+        if len(wavesStruct['tVec']) != len(tVec) or wavesStruct['Ts'] != Ts:
+            raise ValueError('All seas of an ensemble need the same tVec and Ts.')
+
+    if x0s is None:
+        x0s = np.tile(shipStruct['x0'], (len(wavesStructs), 1))
+    x0s = np.atleast_2d(np.asarray(x0s, dtype=np.float64))
+    n = x0s.shape[0]
+    if not isShared and len(wavesStructs) != n:
+        raise ValueError('Got %d seas for %d initial states.' % (len(wavesStructs), n))
+
+    # Load ship, the geometry is shared by all members
+    if hull is None:
+        hull = loadHull(shipStruct)
+    bodyHull = createBodyHull(hull)
+    cog = hull['cog']
+    model = createShipModel(shipStruct, Ts)
+    cogVec = np.zeros((n, len(tVec), 3))
+
+    # ----- Initialize all states and set 1st state
+    states = np.zeros((n, 12, len(tVec)))
+    states[:, 0:3, 0] = [cog[0], -cog[1], -cog[2]]
+    states[:, 3:, 0] = x0s
+
+    # ----- The hulls are posed from the current states every step
+    kernel = createStepKernel(model, states[:, :, 0])
+
+    # ----- A procedural sea is marched in time alongside the ships
+    waveSteppers = [createWaveStepper(wavesStruct['components'], tVec[0], Ts) if 'components' in wavesStruct else None
+                    for wavesStruct in wavesStructs]
+    # ----- State update for all time steps
+    for tIdx in range(len(tVec)-1):
+        cogVec[:, tIdx, :] = kernel['cog']
+        facePoints = posedFacePoints(bodyHull, kernel['rotation'], kernel['cog'])
+        # ------- Wave heights at the faces of every member
+        if isShared:
+            # One lookup for the face points of all members
+            waveHeights = sampleWaves(wavesStructs[0], facePoints, tIdx, waveSteppers[0])
+        else:
+            waveHeights = np.stack([sampleWaves(wavesStruct, facePoints[i], tIdx, waveSteppers[i])
+                                    for i, wavesStruct in enumerate(wavesStructs)])
+        for waveStepper in waveSteppers:
+            if waveStepper is not None:
+                advanceWaveStepper(waveStepper)
+
+        # ------- Sum of all forces F_net & sum of all torques Tau_net
+        F_net, Tau_net = hydrostaticForcesAndTorques(bodyHull, kernel['rotation'], facePoints, waveHeights,
+                                                     model['ro'], model['g'])
+
+        # ------- Time-update, the hulls follow with the new poses
+        stepStates(kernel, F_net, Tau_net, model)
+        states[:, :, tIdx+1] = kernel['states']
+
+    return states, hull['faces'], hull['vertices'], cogVec
@@ -0,0 +1,234 @@
+import numpy as np
+import os
+import sys
+import glob
+import hashlib
+import itertools
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Append the relative path to the help-files folder
+current_dir = os.path.dirname(os.path.abspath(__file__))
+help_files_path = os.path.join(current_dir, 'help-files')
+sys.path.append(help_files_path)
+from simulateWaves import createWaveComponents
+from simulateShip import loadHull
+from simulateShipEnsemble import simulateShipEnsemble
+from loadWavesFile import loadWavesFile
+from sharedWaves import shareWaves, attachWaves
+
+# Scenario fields that describe the sea, the others override shipStruct
+seaFields = ['seaState', 'beta', 'U', 'lambbda', 'muVec', 'dmu', 'seed']
+# Ship fields that define the hull geometry
+hullFields = ['file', 'verticesPos', 'cogOffset']
+
+# Hulls loaded by this (worker) process, keyed by their hull fields
+workerHulls = {}
+# Sea shared by all runs of a sweep, attached once per worker process
+workerWaves = {'wavesStruct': None, 'shm': None}
+# Digests of the hull files, keyed by their path, size and modification time
+hullDigests = {}
+
+def scenarioGrid(**values):
+    '''
+    SCENARIOGRID Returns the list of scenarios (dicts) of all combinations of
+    the given values, e.g.
+      scenarioGrid(seaState=[3, 6], beta=[np.pi, 3*np.pi/4], U=[0],
+                   refSpeedU=[0, 7], x0=[[0, 0, 0, 0, 0, 0, 0, 0, 0]])
+    gives 8 scenarios. Sea fields (seaState, beta, U and the optional
+    lambbda, muVec, dmu and seed of createWaveComponents) define the sea, all
+    other fields override the same field of shipStruct.
+    '''
+    names = list(values.keys())
+    return [dict(zip(names, combination)) for combination in itertools.product(*values.values())]
+
+def scenarioKey(scenario, shipStruct, tVec, wavesFile = None):
+    # Hash of everything that defines a run, names the result file so that a
+    # finished run is found again when a sweep is resumed: the scenario, the
+    # shipStruct it overrides, the contents of the hull file, the time
+    # vector and, for a shared waves file, its path, size and modification
+    # time. Changing the ship or regenerating the waves file thus starts new
+    # runs instead of returning the old results.
+    key = hashlib.sha256()
+    if wavesFile is not None:
+        stat = os.stat(wavesFile)
+        key.update(os.path.abspath(wavesFile).encode())
+        key.update(np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64).tobytes())
+    runStruct = dict(shipStruct, **scenario)
+    hashFields(key, runStruct)
+    key.update(hullDigest(runStruct['file']))
+    key.update(np.asarray(tVec, dtype=np.float64).tobytes())
+    return key.hexdigest()[:16]
+
+def seaSeed(scenario, tVec):
+    # Default seed of the procedural sea of a scenario, a hash of its sea
+    # fields and the time vector only. All ship variants of a sea then run
+    # in the same random sea, and reruns get it again.
+    key = hashlib.sha256()
+    hashFields(key, {name: value for name, value in scenario.items() if name in seaFields})
+    key.update(np.asarray(tVec, dtype=np.float64).tobytes())
+    return int(key.hexdigest()[:8], 16)
+
+def hashFields(key, struct):
+    # Adds the names and values of the fields of struct to the hash key,
+    # numbers as float64 so that 7 and 7.0 give the same hash
+    for name in sorted(struct):
+        value = np.asarray(struct[name])
+        if value.dtype.kind in 'biuf':
+            value = value.astype(np.float64).tobytes()
+        else:
+            value = repr(value.tolist()).encode()
+        key.update(name.encode())
+        key.update(value)
+
+def hullDigest(file):
+    # SHA-256 of the contents of a hull file, read once per version of it
+    stat = os.stat(file)
+    stamp = (os.path.abspath(file), stat.st_size, stat.st_mtime_ns)
+    if stamp not in hullDigests:
+        digest = hashlib.sha256()
+        with open(file, 'rb') as fid:
+            for block in iter(lambda: fid.read(2**20), b''):
+                digest.update(block)
+        hullDigests[stamp] = digest.digest()
+    return hullDigests[stamp]
+
+def simulateSweep(scenarios, shipStruct, tVec, resultsDir, workers = None, wavesFile = None):
+    '''
+    SIMULATESWEEP Runs the ship simulation for every scenario on a pool of
+    worker processes and stores the results in resultsDir.
+    Inputs:
+      - scenarios:  list of dicts, e.g. from scenarioGrid. Every scenario
+                    gets a procedural sea from createWaveComponents with its
+                    sea fields; the random sea is seeded with 'seed', or
+                    with a seed derived from the sea fields and tVec (see
+                    seaSeed), so that reruns and all ship variants of a
+                    sea get the same sea;
+      - shipStruct: struct containing STL file and other ship properties,
+                    as in simulateShip; fields given in a scenario replace
+                    the ones in shipStruct for that run;
+      - tVec:       time vector of all runs (uniform, Ts = tVec(2)-tVec(1));
+      - resultsDir: directory of the result store. Every run is written to
+                    run_<key>.npz (see loadSweep), key being a hash of the
+                    scenario, shipStruct, the hull file, tVec and the waves
+                    file (see scenarioKey). Runs whose file already exists are
+                    skipped, so an interrupted sweep resumes where it
+                    stopped;
+      - workers:    number of worker processes, default os.cpu_count();
+      - wavesFile:  optional waves file used by all runs instead of the
+                    procedural seas; the sea fields of the scenarios are then
+                    ignored and tVec is taken from the file (pass None). The
+                    file is loaded once and its grid published with
+                    shareWaves, the workers attach to it without copying.
+    Output:
+      - files:      result file of every scenario, in order.
+    Each worker loads the hull once (see loadHull) and keeps it for all the
+    runs it gets. The files are written to a temporary name first, so a run
+    that is interrupted leaves no result behind.
+    '''
+    os.makedirs(resultsDir, exist_ok=True)
+    if wavesFile is not None:
+        tVec = loadWavesFile(wavesFile)['tVec'] if tVec is None else tVec
+    tVec = np.asarray(tVec, dtype=np.float64)
+    keys = [scenarioKey(scenario, shipStruct, tVec, wavesFile) for scenario in scenarios]
+    files = [os.path.join(resultsDir, f'run_{key}.npz') for key in keys]
+    todo = [i for i, file in enumerate(files) if not os.path.isfile(file)]
+    print(f'Sweep: {len(scenarios)} runs, {len(scenarios) - len(todo)} already done')
+    if not todo:
+        return files
+
+    workers = workers or os.cpu_count()
+    sharedStruct, shm = (None, None) if wavesFile is None else shareWaves(loadWavesFile(wavesFile))
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=attachSweepWaves, initargs=(sharedStruct,)) as pool:
+            futures = [pool.submit(sweepRun, scenarios[i], shipStruct, tVec, keys[i], files[i]) for i in todo]
+            for done, future in enumerate(as_completed(futures), 1):
+                print(f'Sweep: run {future.result()} done ({done}/{len(todo)})')
+    finally:
+        if shm is not None:
+            shm.close()
+            shm.unlink()
+    return files
+
+def attachSweepWaves(sharedStruct):
+    # Initializer of the sweep workers: attaches to the shared sea, if any
+    if sharedStruct is not None:
+        workerWaves['wavesStruct'], workerWaves['shm'] = attachWaves(sharedStruct)
+
+def sweepRun(scenario, shipStruct, tVec, key, file):
+    '''
+    SWEEPRUN Worker of simulateSweep: simulates one scenario and writes its
+    states, cogVec and metadata to file. Returns the key of the run.
+    '''
+    startTime = time.time()
+    shipStruct = dict(shipStruct)
+    shipStruct.update({name: value for name, value in scenario.items() if name not in seaFields})
+    hullKey = repr([shipStruct[name] for name in hullFields])
+    if hullKey not in workerHulls:
+        workerHulls[hullKey] = loadHull(shipStruct)
+
+    seed = scenario.get('seed', seaSeed(scenario, tVec))
+    if workerWaves['wavesStruct'] is not None:
+        wavesStruct = workerWaves['wavesStruct']
+    else:
+        # Hs is drawn with random (getSignificantWaveHeight), the components
+        # with np.random
+        random.seed(seed)
+        np.random.seed(seed)
+        waveOptions = {name: scenario[name] for name in ['lambbda', 'muVec', 'dmu'] if name in scenario}
+        components = createWaveComponents(scenario['seaState'], scenario['beta'], scenario['U'], **waveOptions)
+        wavesStruct = {
+            'components': components,
+            'beta': scenario['beta'],
+            'tVec': tVec,
+            'Ts': tVec[1] - tVec[0]
+        }
+    states, _, _, cogVec = simulateShipEnsemble(wavesStruct, shipStruct, [shipStruct['x0']], workerHulls[hullKey])
+
+    metadata = {f'scenario_{name}': np.asarray(value) for name, value in scenario.items()}
+    tmpFile = f'{file}.{os.getpid()}.tmp.npz'
+    np.savez(tmpFile, states=states[0], cogVec=cogVec[0], tVec=tVec, key=key, seed=seed,
+             elapsed=time.time() - startTime, **metadata)
+    os.replace(tmpFile, file)
+    return key
+
+def loadSweep(resultsDir, scenarios = None, shipStruct = None, tVec = None, wavesFile = None):
+    '''
+    LOADSWEEP Collects the result store of simulateSweep.
+    Inputs:
+      - resultsDir:      directory given to simulateSweep;
+      - scenarios, shipStruct, tVec, wavesFile: optional, only load the
+                         runs of these scenarios, in this order (all must be
+                         done), with the shipStruct, tVec and wavesFile
+                         given to simulateSweep; shipStruct is required
+                         with scenarios. By default all runs in resultsDir
+                         are loaded.
+    Output:
+      - results: dict with 'scenarios' (list of dicts, from the stored
+                 metadata), 'states' (R, 12, length(tVec)), 'cogVec'
+                 (R, length(tVec), 3), 'keys', 'seeds' and 'elapsed'
+                 (seconds per run).
+    '''
+    if scenarios is None:
+        files = sorted(glob.glob(os.path.join(resultsDir, 'run_*.npz')))
+    else:
+        if shipStruct is None:
+            raise ValueError('loadSweep needs the shipStruct given to simulateSweep to find the runs of scenarios.')
+        if wavesFile is not None:
+            tVec = loadWavesFile(wavesFile)['tVec'] if tVec is None else tVec
+        files = [os.path.join(resultsDir, f'run_{scenarioKey(scenario, shipStruct, tVec, wavesFile)}.npz')
+                 for scenario in scenarios]
+    results = {'scenarios': [], 'states': [], 'cogVec': [], 'keys': [], 'seeds': [], 'elapsed': []}
+    for file in files:
+        with np.load(file) as run:
+            results['scenarios'].append({name[len('scenario_'):]: run[name].tolist()
+                                         for name in run.files if name.startswith('scenario_')})
+            results['states'].append(run['states'])
+            results['cogVec'].append(run['cogVec'])
+            results['keys'].append(str(run['key']))
+            results['seeds'].append(int(run['seed']))
+            results['elapsed'].append(float(run['elapsed']))
+    for name in ['states', 'cogVec', 'elapsed']:
+        results[name] = np.array(results[name])
+    return results
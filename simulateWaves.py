@@ -2,6 +2,8 @@ import numpy as np
 
 import sys
 import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
 
 # Get the current directory
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -10,8 +12,14 @@ help_files_path = os.path.join(current_dir, 'help-files')
 sys.path.append(help_files_path)
 from getSignificantWaveHeight import getSignificantWaveHeight
 from wavespec import wavespec
+from spread import spread
+from waveElevation import waveElevation, marchWaves
+from fftWaves import createFftComponents, fftElevation
+from projectedWaves import isLongCrested, createProjectedWaves, sampleProjectedWaves
 
-def simulateWaves(seaState, xVec, yVec, beta, tVec, U, lambbda = 1, muVec = [], dmu = 0):
+def simulateWaves(seaState, xVec, yVec, beta, tVec, U, lambbda = 1, muVec = [], dmu = 0, maxMemory = 2**28,
+                  outFile = None, pointsPerWavelength = None, method = 'direct', workers = None,
+                  nFrequencies = None, nDirections = None):
     '''    
     SIMULATEWAVES(seaState, xVec, yVec, beta, tVec, U , lambda, muVec, dmu) 
     Takes in sea state and plots a wave height. Uses the Bretschneider spectrum.
@@ -28,6 +36,40 @@ def simulateWaves(seaState, xVec, yVec, beta, tVec, U, lambbda = 1, muVec = [],
       - dmu:      direction interval taken in muVec. Used if muVec ~= [].
       - lambbda:   waveLength. If a sea with infinite depth is assumed, set
                   lambda to [].
+      - maxMemory: approximate ceiling in bytes for the temporary arrays
+                  used while summing the wave components.
+      - outFile:  optional path to a .npy file. If given, the waves are
+                  generated in time slabs that are written to this file as
+                  they are done, so the whole field is never held in RAM.
+                  The file is stored time-major, (length(tVec), length(yVec),
+                  length(xVec)), and a read-only memory-mapped view with the
+                  usual (y, x, t) indexing is returned.
+      - pointsPerWavelength: optional. For long-crested seas, synthesise the
+                  field on a 1-D axis along the wave direction with this many
+                  samples per shortest wavelength and interpolate the grid
+                  from it (see projectedWaves.py). Ignored for short-crested
+                  seas.
+      - method:   'direct' (default) sums the cosine of every wave
+                  component in every cell. 'fft' places the spectrum on the
+                  wavenumber grid of xVec, yVec and makes every time frame
+                  with an inverse 2-D FFT (see fftWaves.py). It needs uniform
+                  grids, assumes deep water and is statistically equivalent
+                  to the direct method (same spectrum and Hs), not equal.
+                  'phasor' uses the direct components but advances each one
+                  in time by complex multiplication with exp(1i*w*Ts) instead
+                  of evaluating cos at every sample (see marchWaves). It
+                  needs a uniformly spaced tVec.
+      - workers:  optional number of processes. The grid is split into tiles
+                  (rows of yVec, or time slabs for 'fft') that a process pool
+                  generates with the same components. Workers write straight
+                  into shared memory, or into outFile if given.
+      - nFrequencies, nDirections: optional numbers of components. Instead
+                  of the fixed dw = 0.1 grid (and the directions of muVec),
+                  the spectrum (and the spreading function over the range of
+                  muVec) is split into bands of equal energy, one component
+                  per band (see createWaveComponents). The synthesis cost is
+                  proportional to the number of components, and equal-energy
+                  bands reach the same Hs and spectral shape with fewer.
     Ouput:
       - waves:    if ~is3d, then size(waves) = (1, length(tVec)), where waves
                   is equal to the wave height in some point in the sea. If  
@@ -37,8 +79,39 @@ def simulateWaves(seaState, xVec, yVec, beta, tVec, U, lambbda = 1, muVec = [],
                   and yVec over an interval of time tVec.
     '''
     print('Creating waves...')
+    if method == 'fft':
+        components = createFftComponents(getSignificantWaveHeight(seaState), beta, U, xVec, yVec, muVec, dmu)
+    elif method in ('direct', 'phasor'):
+        components = createWaveComponents(seaState, beta, U, lambbda, muVec, dmu, nFrequencies, nDirections)
+    else:
+        raise ValueError(f"Unknown method '{method}', use 'direct', 'fft' or 'phasor'.")
+    if workers is not None:
+        waves = parallelWaves(components, xVec, yVec, tVec, workers, outFile, maxMemory, pointsPerWavelength, method)
+    elif outFile is None:
+        waves = synthesizeWaves(components, xVec, yVec, tVec, maxMemory, pointsPerWavelength, method)
+    else:
+        waves = streamWaves(components, xVec, yVec, tVec, outFile, maxMemory, pointsPerWavelength, method)
+    print("Done creating waves!")
+    return waves
+
+def createWaveComponents(seaState, beta, U, lambbda = 1, muVec = [], dmu = 0, nFrequencies = None, nDirections = None):
+    '''
+    CREATEWAVECOMPONENTS Draws the set of frequencies, directions and phases
+    used to generate the waves and returns them as flattened components, one
+    entry per (frequency, direction) pair. Inputs as in simulateWaves.
+    With nFrequencies, the spectrum on [0, 3) rad/s is split into
+    nFrequencies bands holding the same part of the variance m0 and every
+    component gets the amplitude sqrt(2*m0/nFrequencies) and a random
+    frequency in its band (see equalEnergySamples). With nDirections, the
+    directions are drawn the same way from equal parts of the spreading
+    function over [muVec(1) - dmu/2, muVec(end) + dmu/2].
+    Ouput:
+      - components: dict with the arrays 'frequencies', 'wavenumbers',
+                    'directions' (angle of propagation relative to the grid,
+                    i.e. -beta or mu_i - beta), 'amplitudes' and 'phases',
+                    and the scalars 'beta', 'U' and 'Hs'.
+    '''
     g = 9.81
-    lambbda = np.array(lambbda)
     # Get significant wave height
     Hs = getSignificantWaveHeight(seaState)
 
@@ -52,74 +125,203 @@ def simulateWaves(seaState, xVec, yVec, beta, tVec, U, lambbda = 1, muVec = [],
         B = 999999999999999 # Set B to a large number if Hs = 0 
     specType = 1  # Bretschneider (@ Fossen pg 203)
     S = wavespec(specType, [A, B], wVec, 0)
-    S[0] = 0  # the first element is NaN for some reason
-
-    waves = np.zeros((len(yVec), len(xVec), len(tVec)))
 
     # Get the set of frequencies, directions and phases that will be used to
-    # generate waves for all points in the grid:
-    waveFrequencies = np.zeros(len(wVec))
-    for k in range(len(waveFrequencies)):
-        waveFrequencies[k] = wVec[k] - dw/2 + dw * np.random.rand()
+    # generate waves for all points in the grid. The random numbers are drawn
+    # in the same order as the original per-element loops.
+    if nFrequencies is None:
+        waveFrequencies = wVec - dw/2 + dw * np.random.rand(len(wVec))
+        frequencyVariances = S * dw
+    else:
+        spectrum = lambda w: wavespec(specType, [A, B], w, 0)
+        waveFrequencies, m0 = equalEnergySamples(np.linspace(0, 3, 3001), spectrum, nFrequencies)
+        frequencyVariances = np.full(nFrequencies, m0 / nFrequencies)
 
     if len(muVec) > 0:  # Short-crested wave
-        waveDirections = np.zeros(len(muVec))
-        for i in range(len(waveDirections)):
-            waveDirections[i] = muVec[i] - dmu/2 + dmu * np.random.rand()
+        if nDirections is None:
+            waveDirections = np.asarray(muVec) - dmu/2 + dmu * np.random.rand(len(muVec))
+            directionWeights = spread(waveDirections) * dmu
+        else:
+            muRange = np.linspace(muVec[0] - dmu/2, muVec[-1] + dmu/2, 1001)
+            waveDirections, spreadSum = equalEnergySamples(muRange, spread, nDirections)
+            directionWeights = np.full(nDirections, spreadSum / nDirections)
         sizeWaveDirections = len(waveDirections)
     else:
         sizeWaveDirections = 1
 
-    wavePhases = np.zeros((len(waveFrequencies),sizeWaveDirections))
-    for k in range(len(waveFrequencies)):
-        for i in range(sizeWaveDirections):
-            wavePhases[k, i] = 2 * np.pi * np.random.rand()
-    # Get the wave heights for all coordinates (x, y) for all times in tVec:
-    for yIdx in range(len(yVec)):
-        y = yVec[yIdx]
-        for xIdx in range(len(xVec)):
-            x = xVec[xIdx]
-
-            # For each coordinate (x, y), sum the contribution of all the waves
-            # to get the final wave amplitude at that point = sumOfWaves.
-            sumOfWaves = 0
-
-            for k in range(len(waveFrequencies)):
-                w_k = waveFrequencies[k]
-
-                # Long-crested
-                if len(muVec) == 0:
-                    if lambbda is not None:
-                        # Lambda is passed as an argument
-                        coeff = 2 * np.pi / lambbda
-                    else:
-                        # Infinite depth sea assumed
-                        coeff = w_k ** 2 / g
-                    e_k = wavePhases[k]
-                    amp = np.sqrt(2 * S[k] * dw)
-                    wave = amp * np.cos(coeff * ((x + U * tVec) * np.cos(-beta) +
-                                                 y * np.sin(-beta)) -
-                                        w_k * tVec + e_k)
-                    sumOfWaves += wave
-
-                # Short-crested
-                else:
-                    for i in range(len(waveDirections)):
-                        e_ik = wavePhases[0, k]
-                        mu_i = waveDirections[i]
-                        amp = np.sqrt(2 * S[k] * spread(mu_i) * dw * dmu);
-                        wave = amp * np.cos(w_k**2/g * ((x+U*tVec) * np.cos(mu_i - beta) 
-                                    + y * np.sin(mu_i - beta))  
-                                                - w_k * tVec + e_ik)
-                        sumOfWaves += wave
-            waves[yIdx, xIdx, :] = sumOfWaves
-    print("Done creating waves!")
-    return waves
+    wavePhases = 2 * np.pi * np.random.rand(len(waveFrequencies), sizeWaveDirections)
+
+    # Flatten to one entry per component, frequency-major
+    if len(muVec) == 0:  # Long-crested
+        if lambbda is not None and np.size(lambbda) > 0:
+            # Lambda is passed as an argument
+            coeff = np.full(len(waveFrequencies), 2 * np.pi / lambbda)
+        else:
+            # Infinite depth sea assumed
+            coeff = waveFrequencies ** 2 / g
+        frequencies = waveFrequencies
+        wavenumbers = coeff
+        directions = np.full(len(waveFrequencies), -beta)
+        if nFrequencies is None:
+            amplitudes = np.sqrt(2 * S * dw)
+        else:
+            amplitudes = np.sqrt(2 * frequencyVariances)
+    else:  # Short-crested
+        frequencies = np.repeat(waveFrequencies, sizeWaveDirections)
+        wavenumbers = frequencies ** 2 / g
+        directions = np.tile(waveDirections, len(waveFrequencies)) - beta
+        if nFrequencies is None and nDirections is None:
+            amplitudes = np.sqrt(2 * np.outer(S, spread(waveDirections)) * dw * dmu).ravel()
+        else:
+            amplitudes = np.sqrt(2 * np.outer(frequencyVariances, directionWeights)).ravel()
+
+    components = {
+        'frequencies': frequencies,
+        'wavenumbers': wavenumbers,
+        'directions': directions,
+        'amplitudes': amplitudes,
+        'phases': wavePhases.ravel(),
+        'beta': beta,
+        'U': U,
+        'Hs': Hs
+    }
+    return components
+
+def equalEnergySamples(x, density, n):
+    '''
+    EQUALENERGYSAMPLES Splits the integral of density over the grid x into n
+    bands of equal energy and draws one random point in every band, with a
+    probability proportional to the density (so no point falls where the
+    density is zero). Returns the n points and the total energy.
+    '''
+    d = density(x)
+    energy = np.concatenate(([0], np.cumsum((d[1:] + d[:-1]) / 2 * np.diff(x))))
+    # np.interp needs increasing energies, drop the flat parts
+    increasing = np.concatenate(([True], np.diff(energy) > 0))
+    targets = (np.arange(n) + np.random.rand(n)) * energy[-1] / n
+    return np.interp(targets, energy[increasing], x[increasing]), energy[-1]
 
-def spread(mu):
-    if(mu >= -np.pi/2 and mu <= np.pi/2):
-        return ((2/np.pi)*np.cos(mu)**2)
+def synthesizeWaves(components, xVec, yVec, tVec, maxMemory = 2**28, pointsPerWavelength = None, method = 'direct'):
+    '''
+    SYNTHESIZEWAVES Evaluates the wave components on the grid defined by xVec
+    and yVec for all times in tVec. Returns waves of size
+    (length(yVec), length(xVec), length(tVec)). FFT components (from
+    createFftComponents) carry their own grid and are evaluated by FFT.
+    '''
+    if 'spectrum' in components:
+        return fftElevation(components, tVec, maxMemory)
+    x, y = np.meshgrid(xVec, yVec)
+    waves = gridElevation(components, x, y, tVec, maxMemory, pointsPerWavelength, method)
+    return waves.reshape((len(yVec), len(xVec), len(tVec)))
+
+def gridElevation(components, x, y, tVec, maxMemory = 2**28, pointsPerWavelength = None, method = 'direct'):
+    '''
+    GRIDELEVATION Wave heights of size (number of points, length(tVec)) at the
+    points (x, y). Long-crested seas take the projected 1-D fast path when
+    pointsPerWavelength is given, all other seas sum the components directly,
+    or by time marching if method is 'phasor'.
+    '''
+    if pointsPerWavelength is not None and isLongCrested(components):
+        projected = createProjectedWaves(components, x, y, tVec, pointsPerWavelength, maxMemory)
+        return sampleProjectedWaves(projected, x, y)
+    if method == 'phasor':
+        return marchWaves(components, x, y, tVec, maxMemory=maxMemory)
+    return waveElevation(components, x, y, tVec, maxMemory)
+
+def streamWaves(components, xVec, yVec, tVec, outFile, maxMemory = 2**28, pointsPerWavelength = None, method = 'direct'):
+    '''
+    STREAMWAVES Evaluates the wave components on the grid slab by slab in time
+    and writes every slab to the .npy file outFile. Half of maxMemory is used
+    for the slab itself and half for the temporaries of waveElevation, so the
+    peak memory does not depend on length(tVec). Returns the file opened as a
+    read-only memory map, transposed to size (length(yVec), length(xVec),
+    length(tVec)).
+    '''
+    x, y = np.meshgrid(xVec, yVec)
+    cells = len(yVec) * len(xVec)
+    waves = np.lib.format.open_memmap(outFile, mode='w+', dtype=np.float64,
+                                      shape=(len(tVec), len(yVec), len(xVec)))
+    tSlab = int(max(1, (maxMemory // 2) // (8 * max(cells, 1))))
+    for t0 in range(0, len(tVec), tSlab):
+        if 'spectrum' in components:
+            slab = fftElevation(components, tVec[t0:t0 + tSlab], maxMemory // 2)
+            waves[t0:t0 + tSlab] = np.moveaxis(slab, -1, 0)
+        else:
+            slab = gridElevation(components, x, y, tVec[t0:t0 + tSlab], maxMemory // 2, pointsPerWavelength, method)
+            waves[t0:t0 + tSlab] = slab.T.reshape((-1, len(yVec), len(xVec)))
+        waves.flush()
+    del waves
+    return np.load(outFile, mmap_mode='r').transpose(1, 2, 0)
+
+def parallelWaves(components, xVec, yVec, tVec, workers, outFile = None, maxMemory = 2**28, pointsPerWavelength = None,
+                  method = 'direct'):
+    '''
+    PARALLELWAVES Generates the waves with a pool of worker processes. Direct
+    components are split into tiles of rows of yVec, FFT components into
+    slabs of tVec. Only the components and the tile limits are sent to the
+    workers; they write their tile into a shared memory block, or into the
+    time-major .npy file outFile, so no large array is pickled. maxMemory is
+    shared between the workers. Returns the same as synthesizeWaves, or as
+    streamWaves if outFile is given.
+    '''
+    shape = (len(yVec), len(xVec), len(tVec))
+    if outFile is None:
+        shm = shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(shape)) * 8))
+        target = {'shm': shm.name, 'shape': shape}
+    else:
+        np.lib.format.open_memmap(outFile, mode='w+', dtype=np.float64,
+                                  shape=(len(tVec), len(yVec), len(xVec))).flush()
+        target = {'outFile': outFile}
+
+    # A few tiles per worker to balance the load
+    nTiles = 4 * workers
+    if 'spectrum' in components:
+        limits = np.linspace(0, len(tVec), min(nTiles, len(tVec)) + 1).astype(int)
+        tiles = [(0, len(yVec), t0, t1) for t0, t1 in zip(limits[:-1], limits[1:])]
     else:
-        return 0
+        limits = np.linspace(0, len(yVec), min(nTiles, len(yVec)) + 1).astype(int)
+        tiles = [(y0, y1, 0, len(tVec)) for y0, y1 in zip(limits[:-1], limits[1:])]
+    tasks = [(components, xVec, yVec, tVec, tile, target, maxMemory // workers, pointsPerWavelength, method)
+             for tile in tiles]
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(waveTile, tasks))
+        if outFile is None:
+            waves = np.ndarray(shape, dtype=np.float64, buffer=shm.buf).copy()
+    finally:
+        if outFile is None:
+            shm.close()
+            shm.unlink()
+    if outFile is None:
+        return waves
+    return np.load(outFile, mmap_mode='r').transpose(1, 2, 0)
 
-    
\ No newline at end of file
+def waveTile(task):
+    '''
+    WAVETILE Worker of parallelWaves: generates the rows y0:y1 and times
+    t0:t1 of the grid, in time chunks bounded by maxMemory, and writes them
+    into the shared memory block or the .npy file described by target.
+    '''
+    components, xVec, yVec, tVec, (y0, y1, t0, t1), target, maxMemory, pointsPerWavelength, method = task
+    if 'shm' in target:
+        shm = shared_memory.SharedMemory(name=target['shm'])
+        waves = np.ndarray(target['shape'], dtype=np.float64, buffer=shm.buf)
+    else:
+        fileWaves = np.load(target['outFile'], mmap_mode='r+')
+        waves = fileWaves.transpose(1, 2, 0)
+    x, y = np.meshgrid(xVec, yVec[y0:y1])
+    cells = max(x.size, 1)
+    tChunk = int(max(1, (maxMemory // 2) // (8 * cells)))
+    for tc in range(t0, t1, tChunk):
+        t = tVec[tc:min(tc + tChunk, t1)]
+        if 'spectrum' in components:
+            slab = fftElevation(components, t, maxMemory // 2)
+        else:
+            slab = gridElevation(components, x, y, t, maxMemory // 2, pointsPerWavelength, method)
+            slab = slab.reshape((y1 - y0, len(xVec), len(t)))
+        waves[y0:y1, :, tc:tc + len(t)] = slab
+    if 'shm' in target:
+        del waves
+        shm.close()
+    else:
+        fileWaves.flush()
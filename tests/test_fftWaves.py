@@ -0,0 +1,59 @@
+import os
+import random
+import sys
+import numpy as np
+import pytest
+
+# The modules are imported from the repository root and help-files
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root)
+sys.path.append(os.path.join(root, 'help-files'))
+from simulateWaves import simulateWaves
+from fftWaves import createFftComponents
+
+# Deep water (lambbda=None), as assumed by the FFT method
+xVec = np.arange(0, 1024, 2.0)
+yVec = np.arange(0, 64, 2.0)
+tVec = np.arange(0, 256, 1.0)
+
+def seededWaves(method, seed, **options):
+    # Hs is drawn with random (getSignificantWaveHeight), the components
+    # with np.random
+    random.seed(seed)
+    np.random.seed(seed)
+    return simulateWaves(4, xVec, yVec, options.pop('beta', 0.0), tVec, 0, lambbda=None, method=method, **options)
+
+def normalizedSpectrum(waves, axis, spacing):
+    # Mean periodogram along one axis of the field, normalized to unit sum,
+    # and its angular wavenumbers (or frequencies)
+    samples = np.moveaxis(waves - waves.mean(), axis, -1)
+    power = np.mean(np.abs(np.fft.rfft(samples, axis=-1))**2, axis=(0, 1))
+    return 2 * np.pi * np.fft.rfftfreq(samples.shape[-1], spacing), power / power.sum()
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_fft_and_direct_spectra_agree(seed):
+    direct = seededWaves('direct', seed)
+    fft = seededWaves('fft', seed)
+    # Hs within 5 %
+    assert 4 * np.std(fft) == pytest.approx(4 * np.std(direct), rel=0.05)
+    # Wavenumber (along x, the wave direction for beta = 0) and frequency
+    # spectra: mean within 10 %, cumulative spectra within 0.2
+    for axis, spacing in ((1, xVec[1] - xVec[0]), (2, tVec[1] - tVec[0])):
+        k, directSpectrum = normalizedSpectrum(direct, axis, spacing)
+        _, fftSpectrum = normalizedSpectrum(fft, axis, spacing)
+        assert k @ fftSpectrum == pytest.approx(k @ directSpectrum, rel=0.1)
+        assert np.max(np.abs(np.cumsum(fftSpectrum) - np.cumsum(directSpectrum))) < 0.2
+
+def test_short_crested_significant_wave_height():
+    dmu = np.pi / 18
+    muVec = np.arange(-np.pi / 2, np.pi / 2 + dmu / 2, dmu)
+    direct = seededWaves('direct', 0, beta=0.3, muVec=muVec, dmu=dmu)
+    fft = seededWaves('fft', 0, beta=0.3, muVec=muVec, dmu=dmu)
+    # Hs within 10 %
+    assert 4 * np.std(fft) == pytest.approx(4 * np.std(direct), rel=0.1)
+
+def test_non_uniform_grid_is_rejected():
+    with pytest.raises(ValueError):
+        createFftComponents(2.0, 0.0, 0, [0, 1, 3, 4], yVec)
+    with pytest.raises(ValueError):
+        createFftComponents(2.0, 0.0, 0, xVec, [0, 1, 3, 4])